@@ -123,3 +123,14 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# RAG pipeline
+
+# Load the embedding and reranking models when the server starts instead of on the first question
+# (only in the process that serves requests, never for other management commands)
+RAG_WARMUP_MODELS = config('RAG_WARMUP_MODELS', default=False, cast=bool)
+
+# Where generated answers are cached: 'memory' (per process) or the name of a Django cache alias
+# (e.g. 'default' backed by Redis/Memcached, so every worker shares the cached answers)
+RAG_ANSWER_CACHE = config('RAG_ANSWER_CACHE', default='memory')
@@ -1,6 +1,41 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+
+# Adjusting Python path to include backend retrieval module
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+
+def is_serving_process():
+    """
+    False for management commands other than runserver, and for the runserver autoreloader's
+    parent process (only its child, started with RUN_MAIN=true, serves requests).
+    """
+    if os.path.basename(sys.argv[0]) not in ('manage.py', 'django-admin'):
+        return True  # WSGI/ASGI server (gunicorn, uvicorn, ...)
+    if len(sys.argv) < 2 or sys.argv[1] != 'runserver':
+        return False
+    return '--noreload' in sys.argv or os.environ.get('RUN_MAIN') == 'true'
 
 
 class RagConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rag'
+
+    def ready(self):
+        # Load the embedder and reranker once at startup instead of on the first question;
+        # mistral is preloaded in Ollama in the background so a slow or unreachable Ollama never blocks startup
+        if getattr(settings, 'RAG_WARMUP_MODELS', False) and is_serving_process():
+            from app.backend.models import warmup
+            from app.backend.ollama import warm_ollama_in_background
+            warm_ollama_in_background()
+            warmup()
+
+        # Share the answer cache between workers through Django's cache framework
+        cache_alias = getattr(settings, 'RAG_ANSWER_CACHE', 'memory')
+        if cache_alias != 'memory':
+            from django.core.cache import caches
+            from app.backend.retrieve import answer_cache
+            answer_cache.set_backend(caches[cache_alias])
@@ -1,3 +1,305 @@
-from django.test import TestCase
+import importlib.util
+import json
+import os
+import re
+import tempfile
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase
+
+from app.backend.cache import SemanticCache
+from app.backend.retrieve import dense_winner_scores, embed_query, generate_answer_stream, search_patches, semantic_scope
+from app.config import PATCH_DIR
+from app.embedding.embedding_store import EmbeddingStore
+from app.ingestion.generate_chunks import parse_pages
+from app.ingestion.parse_patch import parse_patch_html
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+CHUNKS = ["Darius\nQ - Décimation : dégâts augmentés de 10 à 20."]
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Answers /api/generate with the NDJSON lines of the running test."""
+    lines = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = "".join(json.dumps(line) + "\n" for line in self.lines).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def random_query_vector(text):
+    """Unrelated unit vectors, so no question is answered from the semantic cache of another."""
+    vector = np.random.default_rng().standard_normal(768).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def parse_events(body):
+    """(event, data) pairs of a Server-Sent Events body; plain `data:` frames have the event "message"."""
+    events = []
+    for frame in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in frame.split("\n"))
+        events.append((fields.get("event", "message"), json.loads(fields["data"])))
+    return events
+
+
+class StreamingAnswerTests(SimpleTestCase):
+    """generate_answer_stream and the ask/stream/ view against a stub Ollama (retrieval is mocked out)."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.ollama_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        for target, value in [
+            ("app.backend.ollama.OLLAMA_URL", self.ollama_url),
+            ("app.backend.retrieve.embed_query", random_query_vector),
+            ("app.backend.retrieve.get_latest_patch_version", lambda: "25.07"),
+            ("app.backend.retrieve.retrieve_context", lambda *args, **kwargs: CHUNKS),
+        ]:
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.question = f"Qu'est-ce qui a changé sur Darius ? ({uuid.uuid4().hex[:8]})"
+
+    def stream_view(self):
+        response = self.client.post(
+            "/api/ask/stream/", data=json.dumps({"question": self.question}), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        return parse_events(b"".join(response.streaming_content).decode("utf-8"))
+
+    def test_generate_answer_stream_yields_tokens(self):
+        StubOllamaHandler.lines = [
+            {"response": "Darius ", "done": False}, {"response": "est renforcé.", "done": False}, {"done": True}
+        ]
+        self.assertEqual(list(generate_answer_stream(self.question)), ["Darius ", "est renforcé."])
+
+    def test_generate_answer_stream_ollama_error_line(self):
+        StubOllamaHandler.lines = [{"error": "model 'mistral' not found"}]
+        self.assertEqual(list(generate_answer_stream(self.question)), ["Error: model 'mistral' not found"])
+
+    def test_generate_answer_stream_does_not_cache_interrupted_answer(self):
+        StubOllamaHandler.lines = [{"response": "Darius ", "done": False}, {"error": "out of memory"}]
+        self.assertEqual(list(generate_answer_stream(self.question)), ["Darius ", "Error: out of memory"])
+        StubOllamaHandler.lines = [{"response": "Darius est renforcé.", "done": False}, {"done": True}]
+        self.assertEqual(list(generate_answer_stream(self.question)), ["Darius est renforcé."])
+
+    def test_view_streams_data_frames_then_done(self):
+        StubOllamaHandler.lines = [
+            {"response": "Darius ", "done": False}, {"response": "est renforcé.", "done": False}, {"done": True}
+        ]
+        self.assertEqual(self.stream_view(), [
+            ("message", {"token": "Darius "}),
+            ("message", {"token": "est renforcé."}),
+            ("done", {}),
+        ])
+
+    def test_view_forwards_ollama_error_line(self):
+        StubOllamaHandler.lines = [{"response": "Darius ", "done": False}, {"error": "out of memory"}]
+        self.assertEqual(self.stream_view(), [
+            ("message", {"token": "Darius "}),
+            ("message", {"token": "Error: out of memory"}),
+            ("done", {}),
+        ])
+
+    def test_view_sends_error_event_when_ollama_is_unreachable(self):
+        with mock.patch("app.backend.ollama.OLLAMA_URL", "http://127.0.0.1:9"):
+            events = self.stream_view()
+        self.assertEqual([event for event, _ in events], ["error", "done"])
+        self.assertIn("error", events[0][1])
+
+    def test_view_rejects_missing_question(self):
+        response = self.client.post("/api/ask/stream/", data="{}", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+
+class ParsePatchTests(SimpleTestCase):
+    """parse_patch_html on a saved patch page: same output whatever the parser or the number of workers."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(os.path.join(FIXTURES, "patch-25-07-notes.html"), encoding="utf-8") as f:
+            cls.html = f.read()
+        cls.expected = parse_patch_html(cls.html, parser="html.parser")
+
+    def test_html_parser_matches_bundled_patch(self):
+        with open(os.path.join(PATCH_DIR, "patch_25.07.json"), encoding="utf-8") as f:
+            self.assertEqual(self.expected, json.load(f))
+
+    @skipUnless(importlib.util.find_spec("lxml"), "lxml is not installed")
+    def test_lxml_matches_html_parser(self):
+        self.assertEqual(parse_patch_html(self.html, parser="lxml"), self.expected)
+
+    def test_parse_pages_in_process_pool(self):
+        self.assertEqual(parse_pages([self.html, self.html], workers=2), [self.expected, self.expected])
+
+
+class EmbeddingStoreTests(SimpleTestCase):
+    """On-disk embedding cache: rows survive reloads and an interrupted append does not shift them."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def store(self):
+        return EmbeddingStore(self.directory, "test-model")
+
+    def vector(self, store, text):
+        key = store.key(text)
+        return store.get_many([key])[0].tolist()
+
+    def test_reload(self):
+        store = self.store()
+        store.add_many([store.key("a"), store.key("b")], [[1, 0, 0], [0, 1, 0]])
+        store = self.store()
+        self.assertEqual(len(store), 2)
+        self.assertEqual(self.vector(store, "b"), [0, 1, 0])
+
+    def test_interrupted_append_is_discarded(self):
+        store = self.store()
+        store.add_many([store.key("a"), store.key("b")], [[1, 0, 0], [0, 1, 0]])
+        # Crash after the vectors were appended but before their digests reached the index
+        with open(store.vectors_path, "ab") as f:
+            f.write(np.array([[9, 9, 9]], dtype=np.float32).tobytes())
+
+        store = self.store()
+        store.add_many([store.key("c")], [[0, 0, 1]])
+        for reloaded in (store, self.store()):
+            self.assertEqual(len(reloaded), 3)
+            self.assertEqual(self.vector(reloaded, "a"), [1, 0, 0])
+            self.assertEqual(self.vector(reloaded, "c"), [0, 0, 1])
+
+    def test_appends_from_another_process(self):
+        first, second = self.store(), self.store()
+        first.add_many([first.key("a")], [[1, 0, 0]])
+        second.add_many([second.key("b")], [[0, 1, 0]])
+        store = self.store()
+        self.assertEqual(self.vector(store, "a"), [1, 0, 0])
+        self.assertEqual(self.vector(store, "b"), [0, 1, 0])
+
+
+class DenseWinnerTests(SimpleTestCase):
+    """The reranker skip is decided on the dense ranking, even when BM25 fusion added lexical-only candidates."""
+
+    def test_clear_winner_with_lexical_candidates(self):
+        scores = dense_winner_scores([0.2, None, 0.8, 1.0], margin=0.1)
+        self.assertEqual(scores, [0.9, 0.5, 0.6, 0.5])
+
+    def test_close_dense_scores_keep_the_reranker(self):
+        self.assertIsNone(dense_winner_scores([0.2, None, 0.3], margin=0.1))
+        self.assertIsNone(dense_winner_scores([0.2, None], margin=0.1))
+
+
+class SemanticCacheTests(SimpleTestCase):
+    """Answers are shared between close questions of the same scope only."""
+
+    def setUp(self):
+        self.cache = SemanticCache(maxsize=4, ttl=60, threshold=0.95)
+        self.scope = semantic_scope("What changed on Brand's Q?", ["25.07"])
+        self.vector = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+        self.cache.set(self.vector, self.scope, "Q answer", ["25.07"])
+
+    def test_hit_on_close_vector(self):
+        close = np.array([0.99, 0.14, 0.0], dtype=np.float32)
+        self.assertEqual(self.cache.get(close / np.linalg.norm(close), self.scope), "Q answer")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_miss_below_threshold(self):
+        self.assertIsNone(self.cache.get(np.array([0.0, 1.0, 0.0], dtype=np.float32), self.scope))
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_miss_on_other_ability(self):
+        other = semantic_scope("What changed on Brand's W?", ["25.07"])
+        self.assertNotEqual(other, self.scope)
+        self.assertIsNone(self.cache.get(self.vector, other))
+
+    def test_miss_on_other_champion(self):
+        self.assertIsNone(self.cache.get(self.vector, semantic_scope("What changed on Darius' Q?", ["25.07"])))
+
+    def test_same_ability_across_keyboard_layouts(self):
+        self.assertEqual(semantic_scope("Qu'est-ce qui a changé sur le A de Brand ?", ["25.07"]), self.scope)
+
+    def test_invalidate_patch(self):
+        self.cache.invalidate("25.07")
+        self.assertIsNone(self.cache.get(self.vector, self.scope))
+
+
+class QuestionValidationTests(SimpleTestCase):
+    """Malformed question fields are rejected with a 400 before reaching the pipeline."""
+
+    def post(self, body):
+        return self.client.post("/api/ask/", data=json.dumps(body), content_type="application/json")
+
+    def test_non_string_question(self):
+        response = self.post({"question": 5})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "'question' must be a string.")
+
+    def test_non_object_message(self):
+        self.assertEqual(self.post({"question": "Darius ?", "messages": ["hello"]}).status_code, 400)
+        self.assertEqual(self.post({"question": "Darius ?", "messages": {"role": "user"}}).status_code, 400)
+
+    def test_non_json_object_body(self):
+        self.assertEqual(self.post([{"question": "Darius ?"}]).status_code, 400)
+
+
+class MetricsViewTests(SimpleTestCase):
+    """The metrics endpoint exports the micro-batcher and cache counters next to the stage histograms."""
+
+    def test_batcher_and_cache_metrics(self):
+        with mock.patch("app.backend.retrieve.embed_texts", lambda texts, **kwargs: np.ones((len(texts), 3), np.float32)):
+            embed_query(f"Darius ? ({uuid.uuid4().hex[:8]})")
+        body = self.client.get("/api/metrics/").content.decode("utf-8")
+        self.assertIn('leaguegpt_microbatch_queue_depth{batcher="embed"}', body)
+        self.assertIn('leaguegpt_microbatch_batches_total{batcher="rerank"}', body)
+        misses = re.search(r'^leaguegpt_cache_misses_total\{cache="query_embedding"\} (\d+)$', body, re.M)
+        self.assertGreaterEqual(int(misses.group(1)), 1)
+        self.assertIn('leaguegpt_cache_hits_total{cache="semantic"}', body)
+
+
+class SearchPatchesTests(SimpleTestCase):
+    """History questions fuse BM25 results per patch, like single-patch questions."""
+
+    def setUp(self):
+        dense = {"25.06": [("Darius Q", {"champion": "Darius"}, 0.4)], "25.07": [("Darius W", {"champion": "Darius"}, 0.2)]}
+        lexical = {"25.06": [("Darius passive", {"champion": "Darius"}, None)], "25.07": []}
+        for target, value in [
+            ("app.backend.retrieve.embed_query", random_query_vector),
+            ("app.backend.retrieve.get_collection_safe", lambda name: name),
+            ("app.backend.retrieve.filtered_search", lambda query, collection, version, k: (dense[version], {})),
+            ("app.backend.retrieve.lexical_search", lambda query, version, k, entities: lexical[version]),
+        ]:
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_lexical_results_are_fused(self):
+        results = search_patches("Darius passive", ["25.06", "25.07"], k=3)
+        # BM25 top result of 25.06 ranks with the dense runner-up (reciprocal rank fusion)
+        self.assertEqual([doc for doc, _, _ in results], ["Darius W", "Darius passive", "Darius Q"])
+        self.assertEqual([meta["patch_version"] for _, meta, _ in results], ["25.07", "25.06", "25.06"])
+        self.assertIsNone(results[1][2])
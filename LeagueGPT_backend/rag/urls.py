@@ -1,8 +1,14 @@
 from django.urls import path
-from .views import ask_question
+from .views import ask_question, ask_question_async, ask_question_stream, metrics
 
 # Define URL patterns for the app
 urlpatterns = [
     # Route for handling user questions via POST request
     path("ask/", ask_question),
+    # Same as ask/, but streams the answer tokens as Server-Sent Events
+    path("ask/stream/", ask_question_stream),
+    # Async (ASGI) version of ask/
+    path("ask/async/", ask_question_async),
+    # Prometheus metrics (per-stage latency histograms, micro-batcher and cache counters)
+    path("metrics/", metrics),
 ]
@@ -1,5 +1,6 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 import json
 import sys
@@ -7,7 +8,81 @@ import os
 
 # Adjusting Python path to include backend retrieval module
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
-from app.backend.retrieve import generate_answer  # Your RAG pipeline
+from app.backend.retrieve import generate_answer, generate_answer_stream  # Your RAG pipeline
+from app.backend.async_retrieve import aclose_clients, agenerate_answer
+from app.backend.chroma import select_patch_versions
+from app.backend.metrics import collect_timings, render_metrics
+
+
+class InvalidQuestion(ValueError):
+    """A question request whose fields are well-formed JSON but not valid (answered with a 400)."""
+
+
+def _read_patch_selection(data):
+    """
+    Validates the optional patch selection of a request, e.g. {"last": 3} or {"since": "25.05", "until": "25.07"},
+    and returns the matching indexed versions (None when the request selects nothing).
+    """
+    if not any(data.get(key) is not None for key in ("versions", "since", "until", "last")):
+        return None
+
+    versions = data.get("versions")
+    if versions is not None and (not isinstance(versions, list) or not all(isinstance(v, str) for v in versions)):
+        raise InvalidQuestion("'versions' must be a list of patch versions, e.g. [\"25.06\", \"25.07\"].")
+    for key in ("since", "until"):
+        if data.get(key) is not None and not isinstance(data[key], str):
+            raise InvalidQuestion(f"'{key}' must be a patch version string, e.g. \"25.05\".")
+    last = data.get("last")
+    if last is not None and (isinstance(last, bool) or not isinstance(last, int) or last < 1):
+        raise InvalidQuestion("'last' must be a positive integer.")
+
+    selected = select_patch_versions(versions=versions, since=data.get("since"), until=data.get("until"), last=last)
+    if not selected:
+        raise InvalidQuestion("No indexed patch matches the requested versions.")
+    return selected
+
+
+def _read_question(request):
+    """
+    Decodes the JSON body of a question request.
+    Returns the question, the conversational history
+    and the patch versions to search (None for the latest patch only).
+    Raises json.JSONDecodeError on malformed JSON and InvalidQuestion on invalid fields.
+    """
+    try:
+        data = json.loads(request.body.decode("utf-8"))
+    except UnicodeDecodeError:
+        data = json.loads(request.body.decode("latin-1"))
+    if not isinstance(data, dict):
+        raise InvalidQuestion("The request body must be a JSON object.")
+
+    question = data.get("question") or ""
+    if not isinstance(question, str):
+        raise InvalidQuestion("'question' must be a string.")
+    messages = data.get("messages") or []
+    if not isinstance(messages, list) or not all(isinstance(msg, dict) for msg in messages):
+        raise InvalidQuestion("'messages' must be a list of {\"role\": ..., \"content\": ...} objects.")
+
+    # Only the question is embedded; the history goes to the (token-budgeted) prompt builder
+    history = [
+        {"role": msg["role"], "content": msg["content"]}
+        for msg in messages
+        if msg.get("role") in ("user", "assistant") and isinstance(msg.get("content"), str) and msg["content"]
+    ]
+
+    # Optional patch selection for history questions
+    versions = _read_patch_selection(data)
+
+    return question, history, versions
+
+
+def _answer_payload(answer, request, timings):
+    """JSON body of an answer, with the per-stage timings (ms) when the request asks for them with ?debug=1."""
+    payload = {"answer": answer}
+    if request.GET.get("debug") in ("1", "true"):
+        payload["timings"] = timings.as_dict()
+    return payload
+
 
 @csrf_exempt
 def ask_question(request):
@@ -17,31 +92,86 @@ def ask_question(request):
     """
     if request.method == "POST":
         try:
-            try:
-                data = json.loads(request.body.decode("utf-8"))
-            except UnicodeDecodeError:
-                data = json.loads(request.body.decode("latin-1"))
-
-            question = data.get("question", "")
-            messages = data.get("messages", [])
+            question, history, versions = _read_question(request)
 
             if not question:
                 return JsonResponse({"error": "No question provided."}, status=400)
 
-            # Building prompt with conversation history
-            context_prompt = ""
-            for msg in messages:
-                if msg["role"] == "user":
-                    context_prompt += f"User: {msg['content']}\n"
-                elif msg["role"] == "assistant":
-                    context_prompt += f"Assistant: {msg['content']}\n"
-
-            context_prompt += f"User: {question}\nAssistant:"
-
             # Generate response using RAG pipeline
-            response = generate_answer(context_prompt)
+            with collect_timings() as timings:
+                response = generate_answer(question, history=history, versions=versions)
 
-            return JsonResponse({"answer": response})
+            return JsonResponse(_answer_payload(response, request, timings))
 
         except json.JSONDecodeError:
             return JsonResponse({"error": "Invalid JSON request."}, status=400)
+        except InvalidQuestion as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+
+@csrf_exempt
+async def ask_question_async(request):
+    """
+    Async variant of ask_question for ASGI servers (e.g. `uvicorn core.asgi:application`).
+    Chroma and Ollama are awaited instead of blocking a worker thread for the whole generation.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST requests are allowed."}, status=405)
+
+    try:
+        question, history, versions = _read_question(request)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON request."}, status=400)
+    except InvalidQuestion as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    if not question:
+        return JsonResponse({"error": "No question provided."}, status=400)
+
+    try:
+        with collect_timings() as timings:
+            response = await agenerate_answer(question, history=history, versions=versions)
+    finally:
+        # Under WSGI (runserver) this view runs on a new event loop per request: close its clients with it
+        if not isinstance(request, ASGIRequest):
+            await aclose_clients()
+    return JsonResponse(_answer_payload(response, request, timings))
+
+
+@csrf_exempt
+def ask_question_stream(request):
+    """
+    Streaming variant of ask_question.
+    Forwards the answer tokens as Server-Sent Events while Ollama generates them:
+    `data: {"token": "..."}` for each token, then `event: done`.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST requests are allowed."}, status=405)
+
+    try:
+        question, history, versions = _read_question(request)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON request."}, status=400)
+    except InvalidQuestion as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    if not question:
+        return JsonResponse({"error": "No question provided."}, status=400)
+
+    def events():
+        try:
+            for token in generate_answer_stream(question, history=history, versions=versions):
+                yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # keep nginx from buffering the stream
+    return response
+
+
+def metrics(request):
+    """Prometheus scrape endpoint: stage latency histograms, micro-batcher and cache counters."""
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,242 @@
+# app/backend/async_retrieve.py
+import asyncio
+import inspect
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import chromadb
+import httpx
+from app.backend.chroma import collection_cache_generation, get_collection_safe, get_latest_patch_version
+from app.backend.entities import build_where
+from app.backend.metrics import span
+from app.backend.ollama import generate_payload
+from app.backend.parents import expand_parents
+from app.backend.prompting import build_prompt, rewrite_query
+from app.backend.retrieve import (
+    NO_DATA_ANSWER, detect_entities, embed_query, fuse_lexical, lexical_search, lookup_cached_answer,
+    lookup_semantic_answer, merge_patch_results, rerank_chunks, resolve_versions, store_answer
+)
+from app.config import (
+    INFERENCE_WORKERS, LLM_MODEL, OLLAMA_CONNECT_TIMEOUT, OLLAMA_POOL_SIZE, OLLAMA_TIMEOUT, OLLAMA_URL, RETRIEVAL_BACKEND,
+    get_chroma_host
+)
+
+# === INFERENCE EXECUTOR ===
+# Model calls are CPU-bound: a small bounded pool keeps them off the event loop
+# without letting concurrent requests oversubscribe the CPU.
+_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="rag-inference")
+
+async def run_inference(fn, *args, **kwargs):
+    """Runs a blocking model call in the inference executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, lambda: fn(*args, **kwargs))
+
+# Other blocking work (BM25 scoring, entity / lexical / parent indexes loaded from disk on first use,
+# answer cache lookups that may go to Redis or Memcached) runs in the default executor via asyncio.to_thread.
+
+# === ASYNC CLIENTS (one set per event loop) ===
+# Keyed on the loop object itself (never on id(), which a later loop can reuse). Under ASGI there is one
+# long-lived loop; under WSGI each async view runs on a short-lived loop (async_to_sync), whose clients
+# are closed by aclose_clients() at the end of the request, or dropped once that loop is closed.
+_loop_clients = weakref.WeakKeyDictionary()
+
+def _clients_for_loop():
+    """Returns the {"chroma", "collections", "http"} clients of the running event loop."""
+    for loop in [loop for loop in list(_loop_clients) if loop.is_closed()]:
+        _loop_clients.pop(loop, None)
+    loop = asyncio.get_running_loop()
+    clients = _loop_clients.get(loop)
+    if clients is None:
+        clients = {"chroma": {}, "collections": {}, "http": None}
+        _loop_clients[loop] = clients
+    return clients
+
+async def get_async_chroma_client():
+    """Returns the async Chroma client bound to the running event loop."""
+    host, port = get_chroma_host()
+    chroma_clients = _clients_for_loop()["chroma"]
+    if (host, port) not in chroma_clients:
+        chroma_clients[(host, port)] = await chromadb.AsyncHttpClient(host=host, port=port)
+    return chroma_clients[(host, port)]
+
+def get_async_http_client():
+    """Returns the pooled httpx client bound to the running event loop."""
+    clients = _clients_for_loop()
+    if clients["http"] is None:
+        clients["http"] = httpx.AsyncClient(
+            timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=OLLAMA_POOL_SIZE, max_keepalive_connections=OLLAMA_POOL_SIZE),
+        )
+    return clients["http"]
+
+async def aclose_clients():
+    """Closes the clients of the running event loop (call it before a short-lived loop ends)."""
+    clients = _loop_clients.pop(asyncio.get_running_loop(), None)
+    if clients is None:
+        return
+    if clients["http"] is not None:
+        await clients["http"].aclose()
+    for client in clients["chroma"].values():
+        close = getattr(client, "close", None) or getattr(client, "aclose", None)
+        if close is not None:
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+
+async def aget_collection_safe(name):
+    """Safely retrieves a Chroma collection by name through the async client."""
+    if RETRIEVAL_BACKEND == "local":
+        return get_collection_safe(name)
+
+    client = await get_async_chroma_client()
+    # Handles are dropped together with the sync ones (see app.backend.chroma)
+    collections = _clients_for_loop()["collections"]
+    generation = collection_cache_generation()
+    cached = collections.get(name)
+    if cached is None or cached[0] != generation:
+        try:
+            cached = (generation, await client.get_collection(name=name))
+        except Exception as e:
+            print(f"Error retrieving collection {name}: {e}")
+            return None
+        collections[name] = cached
+    return cached[1]
+
+async def arefresh_collection(name):
+    """Async version of refresh_collection: drops the cached handle of a collection and fetches it again."""
+    if RETRIEVAL_BACKEND == "local":
+        return get_collection_safe(name)
+    _clients_for_loop()["collections"].pop(name, None)
+    return await aget_collection_safe(name)
+
+async def aget_latest_patch_collection():
+    """Retrieves the latest patch collection available."""
+    return await aget_collection_safe(f"patch_{get_latest_patch_version()}")
+
+# === SEARCH ===
+async def asearch_chunks(user_query, collection, k=10, where=None):
+    """Async version of search_chunks: embeds in the executor, queries Chroma without blocking."""
+    query_embedding = await run_inference(embed_query, user_query)
+    query = dict(
+        query_embeddings=[query_embedding], n_results=k, where=where, include=["documents", "metadatas", "distances"]
+    )
+
+    async def run(handle):
+        results = handle.query(**query)
+        if inspect.isawaitable(results):  # the local backend answers synchronously
+            results = await results
+        return results
+
+    try:
+        results = await run(collection)
+    except Exception as e:
+        # A stale handle (collection rebuilt under a new id): fetch the collection again and retry once
+        fresh = await arefresh_collection(collection.name)
+        if fresh is None or fresh is collection:
+            raise
+        print(f"Query on {collection.name} failed ({e}), retrying with a fresh handle")
+        results = await run(fresh)
+    return list(zip(results["documents"][0], results["metadatas"][0], results["distances"][0]))
+
+async def afiltered_search(user_query, collection, version, k=10):
+    """Async version of filtered_search."""
+    entities = await asyncio.to_thread(detect_entities, user_query, version)
+    if entities:
+        try:
+            results = await asearch_chunks(user_query, collection, k=k, where=build_where(entities))
+            if results:
+                return results, entities
+        except Exception as e:
+            print(f"Filtered search failed ({e}), falling back to the whole collection")
+    return await asearch_chunks(user_query, collection, k=k), {}
+
+async def asearch_patch(user_query, collection, version, k=10):
+    """Async version of search_patch."""
+    results, entities = await afiltered_search(user_query, collection, version, k=k)
+    return await asyncio.to_thread(fuse_lexical, user_query, results, version, k=k, entities=entities)
+
+async def asearch_patches(user_query, versions, k=10):
+    """Async version of search_patches: the per-patch queries run concurrently on the event loop."""
+    await run_inference(embed_query, user_query)
+
+    async def search_one(version):
+        collection = await aget_collection_safe(f"patch_{version}")
+        if not collection:
+            return [], []
+        results, entities = await afiltered_search(user_query, collection, version, k=k)
+        return results, await asyncio.to_thread(lexical_search, user_query, version, k=k, entities=entities)
+
+    per_patch = await asyncio.gather(*(search_one(version) for version in versions))
+    return merge_patch_results(versions, per_patch, k=k)
+
+# === GENERATION (Ollama) ===
+async def aask_ollama(prompt: str, model: str = LLM_MODEL):
+    """Sends a prompt to Ollama without blocking the event loop."""
+    client = get_async_http_client()
+    try:
+        response = await client.post(f"{OLLAMA_URL}/api/generate", json=generate_payload(prompt, model))
+    except httpx.HTTPError as e:
+        return f"Error: Ollama request failed ({e})."
+    try:
+        data = response.json()
+        return data.get("response", "Error: No response field in Ollama response.").strip()
+    except Exception:
+        return "Error: Non-JSON response from Ollama."
+
+# === COMPLETE PIPELINE ===
+async def aretrieve_context(question: str, n_chunks=10, versions: List[str] = None, embedded: bool = False):
+    """Async version of retrieve_context."""
+    versions = await asyncio.to_thread(resolve_versions, versions)
+    if not embedded:
+        with span("embed"):
+            await run_inference(embed_query, question)
+
+    with span("search"):
+        if len(versions) > 1:
+            raw = await asearch_patches(question, versions, k=n_chunks)
+        else:
+            version = versions[0]
+            collection = await aget_collection_safe(f"patch_{version}")
+            raw = await asearch_patch(question, collection, version, k=n_chunks) if collection else None
+    if not raw:
+        return None
+    docs = [doc for doc, _, _ in raw]
+    metas = [meta for _, meta, _ in raw]
+    distances = [dist for _, _, dist in raw]
+
+    with span("rerank"):
+        top_docs = await run_inference(rerank_chunks, question, docs, metas, top_k=7, distances=distances)
+
+    meta_by_doc = dict(zip(docs, metas))
+    return await asyncio.to_thread(
+        expand_parents, [doc for doc, _ in top_docs], [meta_by_doc.get(doc) for doc, _ in top_docs]
+    )
+
+async def agenerate_answer(question: str, n_chunks=10, top_k=3, history: List[dict] = None, versions: List[str] = None):
+    """Async version of generate_answer, for ASGI views."""
+    with span("total"):
+        versions = await asyncio.to_thread(resolve_versions, versions)
+        vector = scope = None
+        if not history:
+            with span("embed"):
+                vector = await run_inference(embed_query, question)
+            scope, cached = await asyncio.to_thread(lookup_semantic_answer, question, vector, versions)
+            if cached is not None:
+                return cached
+
+        top_texts = await aretrieve_context(
+            rewrite_query(question, history), n_chunks=n_chunks, versions=versions, embedded=scope is not None
+        )
+        if top_texts is None:
+            return NO_DATA_ANSWER
+
+        cache_key, cached = await asyncio.to_thread(lookup_cached_answer, question, top_texts, versions, history)
+        if cached is not None:
+            return await asyncio.to_thread(store_answer, question, cached, versions, vector, scope)
+
+        with span("prompt"):
+            prompt = build_prompt(top_texts, question, history=history)
+        with span("generate"):
+            response = await aask_ollama(prompt)
+        return await asyncio.to_thread(store_answer, question, response, versions, vector, scope, cache_key=cache_key)
@@ -0,0 +1,93 @@
+# app/backend/batching.py
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Callable, List
+
+# === MICRO-BATCHING ===
+class MicroBatcher:
+    """
+    Coalesces concurrent calls into one batched call.
+    Items submitted from several threads within `max_wait_ms` of each other (up to `max_batch` items)
+    are passed together to `batch_fn`, which must return one result per item, in order.
+    """
+
+    def __init__(self, batch_fn: Callable[[list], list], max_batch: int = 32, max_wait_ms: float = 5.0, name: str = "batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.batches = 0
+        self.items = 0
+        self.max_queue_depth = 0
+        self.batch_sizes = Counter()
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=f"micro-batch-{self.name}", daemon=True)
+                    self._thread.start()
+
+    def submit(self, item) -> Future:
+        """Queues one item and returns a future for its result."""
+        return self.submit_many([item])[0]
+
+    def submit_many(self, items: list) -> List[Future]:
+        """Queues several items (e.g. all the pairs of one request) and returns one future per item."""
+        self._ensure_worker()
+        futures = []
+        for item in items:
+            future = Future()
+            self._queue.put((item, future))
+            futures.append(future)
+        self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return futures
+
+    def map(self, items: list) -> list:
+        """Submits items and waits for their results."""
+        return [future.result() for future in self.submit_many(items)]
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self.batches += 1
+            self.items += len(batch)
+            self.batch_sizes[len(batch)] += 1
+
+            try:
+                results = self.batch_fn([item for item, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def stats(self) -> dict:
+        """Returns queue-depth and batch-size metrics, to tune max_batch and max_wait_ms."""
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+        }
@@ -0,0 +1,227 @@
+# app/backend/cache.py
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+def normalize_query(text: str) -> str:
+    """Normalizes a question into a cache key (case, whitespace and trailing punctuation)."""
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip(" ?!.")
+
+# === LRU CACHE ===
+class LRUCache:
+    """Bounded, thread-safe LRU cache with hit/miss counters."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Returns the size and hit/miss counters of the cache."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+# === TTL + LRU CACHE ===
+class TTLCache(LRUCache):
+    """LRU cache whose entries also expire `ttl` seconds after being set."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        super().__init__(maxsize=maxsize)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        entry = super().get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            with self._lock:
+                self._data.pop(key, None)
+                self.hits -= 1
+                self.misses += 1
+            return default
+        return value
+
+    def set(self, key, value, timeout=None):
+        super().set(key, (time.monotonic() + (timeout or self.ttl), value))
+
+# === ANSWER CACHE ===
+def answer_cache_key(versions, question: str, chunks, history=None) -> str:
+    """
+    Key of a generated answer: patch version(s), normalized question, the set of chunks selected after
+    reranking and the conversation history (an answer depends on all of them).
+    """
+    payload = json.dumps({
+        "versions": sorted(versions or []),
+        "question": normalize_query(question),
+        "chunks": sorted(hashlib.sha1(chunk.encode("utf-8")).hexdigest() for chunk in chunks),
+        "history": [(msg.get("role"), msg.get("content")) for msg in history or []],
+    }, ensure_ascii=False)
+    return "rag-answer:" + hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+class AnswerCache:
+    """
+    Response cache in front of generation.
+    In-process TTL/LRU by default; set_backend() swaps in any object with get(key) / set(key, value, timeout)
+    (e.g. a Django cache, so several workers share answers). Cached entries are dropped when the collection
+    cache generation changes (a patch was (re)indexed); keys also embed the patch version.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 3600):
+        self.ttl = ttl
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.backend = self.local
+        self.generation = None
+
+    def set_backend(self, backend):
+        self.backend = backend if backend is not None else self.local
+
+    def _check_generation(self):
+        from app.backend.chroma import collection_cache_generation
+        generation = collection_cache_generation()
+        if generation != self.generation:
+            self.local.clear()
+            self.generation = generation
+
+    def get(self, key):
+        if self.ttl <= 0:
+            return None
+        self._check_generation()
+        return self.backend.get(key)
+
+    def set(self, key, answer):
+        if self.ttl <= 0:
+            return
+        self._check_generation()
+        self.backend.set(key, answer, self.ttl)
+
+# === SEMANTIC ANSWER CACHE ===
+class SemanticCache:
+    """
+    Answers looked up by meaning rather than by text: a new question reuses the answer of an earlier one when
+    their normalized query vectors have a cosine similarity >= threshold and they share the same scope
+    (patch versions + named entities). Vectors live in one preallocated matrix, so a lookup is a single
+    matrix-vector product; entries expire after `ttl` seconds and the least recently used one is evicted.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600, threshold: float = 0.95):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None  # (maxsize, dim), allocated on the first insert
+        self._scopes = np.full(maxsize, -1, dtype=np.int64)  # scope id per row, -1 = free
+        self._expires = np.zeros(maxsize, dtype=np.float64)
+        self._last_used = np.zeros(maxsize, dtype=np.int64)
+        self._answers = [None] * maxsize
+        self._versions = [()] * maxsize
+        self._scope_ids = {}
+        self._tick = 0
+        self._lock = threading.Lock()
+
+    def _live_rows(self, scope_id):
+        return np.flatnonzero((self._scopes == scope_id) & (self._expires > time.monotonic()))
+
+    def get(self, vector, scope):
+        """Cached answer of the most similar question in the same scope, or None."""
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return None
+        with self._lock:
+            scope_id = self._scope_ids.get(scope)
+            rows = self._live_rows(scope_id) if scope_id is not None and self._vectors is not None else []
+            if len(rows):
+                similarities = self._vectors[rows] @ np.asarray(vector, dtype=np.float32)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    row = rows[best]
+                    self._tick += 1
+                    self._last_used[row] = self._tick
+                    self.hits += 1
+                    return self._answers[row]
+            self.misses += 1
+            return None
+
+    def set(self, vector, scope, answer: str, versions=()):
+        """Stores the answer of a question; `versions` are the patches it depends on (see invalidate)."""
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+            free = np.flatnonzero(self._expires <= time.monotonic())
+            row = int(free[0]) if len(free) else int(np.argmin(self._last_used))
+            self._tick += 1
+            self._vectors[row] = vector
+            self._scopes[row] = self._scope_ids.setdefault(scope, len(self._scope_ids))
+            self._expires[row] = time.monotonic() + self.ttl
+            self._last_used[row] = self._tick
+            self._answers[row] = answer
+            self._versions[row] = tuple(versions)
+
+    def invalidate(self, version: str = None):
+        """Drops the answers built from a patch (every answer when version is None)."""
+        with self._lock:
+            for row in range(self.maxsize):
+                if version is None or version in self._versions[row]:
+                    self._scopes[row] = -1
+                    self._expires[row] = 0.0
+                    self._answers[row] = None
+
+    def clear(self):
+        self.invalidate()
+
+    def __len__(self):
+        return int(np.count_nonzero(self._expires > time.monotonic()))
+
+    def stats(self) -> dict:
+        """Returns the size and hit/miss counters of the cache."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,148 @@
+# app/backend/chroma.py
+import os
+import threading
+import time
+
+import chromadb
+from app.chunking.chunk_store import find_chunk_file, list_chunk_versions
+from app.config import CHUNK_DIR, RETRIEVAL_BACKEND, get_chroma_host
+
+# === POOLED CLIENT + COLLECTION HANDLE CACHE ===
+_clients = {}
+_collections = {}
+_versions = {"stamp": None, "versions": [], "generation": 0}
+_invalidation_listeners = []
+_lock = threading.Lock()
+
+# Touched by invalidate_collection_cache: other processes (Django workers) see it change in _chunk_dir_stamp
+# and drop their handles too, e.g. after `python -m app.embedding.build_chroma --rebuild`
+INVALIDATION_MARKER = os.path.join(CHUNK_DIR, ".collections_updated")
+
+def get_chroma_client():
+    """Returns the process-wide Chroma HTTP client for the configured host."""
+    host, port = get_chroma_host()
+    client = _clients.get((host, port))
+    if client is None:
+        with _lock:
+            client = _clients.get((host, port))
+            if client is None:
+                client = chromadb.HttpClient(host=host, port=port)
+                _clients[(host, port)] = client
+    return client
+
+def get_collection_safe(name):
+    """
+    Safely retrieves a Chroma collection by name, reusing the cached handle when possible.
+    With RETRIEVAL_BACKEND = "local", returns the in-process index instead (same query interface).
+    """
+    if RETRIEVAL_BACKEND == "local":
+        from app.backend.vector_index import get_local_collection
+        return get_local_collection(name)
+
+    collection = _collections.get(name)
+    if collection is not None:
+        return collection
+    try:
+        collection = get_chroma_client().get_collection(name=name)
+    except Exception as e:
+        print(f"Error retrieving collection {name}: {e}")
+        return None
+    with _lock:
+        _collections[name] = collection
+    return collection
+
+def refresh_collection(name):
+    """
+    Drops the cached handle of a collection and fetches it again, for a query that failed on it
+    (the collection may have been deleted and recreated under a new id). Returns None if it is gone.
+    """
+    with _lock:
+        _collections.pop(name, None)
+    return get_collection_safe(name)
+
+def version_key(version: str):
+    """Sort key for patch versions, so that 25.10 comes after 25.9."""
+    return tuple(int(part) if part.isdigit() else 0 for part in version.split("."))
+
+def _chunk_dir_stamp():
+    """Cheap change marker for CHUNK_DIR: a new or rewritten chunk file changes it."""
+    stamp = [os.stat(CHUNK_DIR).st_mtime_ns]
+    if os.path.exists(INVALIDATION_MARKER):
+        stamp.append(os.stat(INVALIDATION_MARKER).st_mtime_ns)
+    latest = _versions["versions"][-1:]
+    for version in latest:
+        path = find_chunk_file(version)
+        if path:
+            stamp.append(os.stat(path).st_mtime_ns)
+    return tuple(stamp)
+
+def list_patch_versions():
+    """Returns the patch versions that have a chunk file, oldest first."""
+    stamp = _chunk_dir_stamp()
+    if stamp != _versions["stamp"]:
+        versions = sorted(list_chunk_versions(), key=version_key)
+        with _lock:
+            # A new or re-chunked patch means its collection may have been rebuilt
+            _collections.clear()
+            _versions["generation"] += 1
+            _versions["versions"] = versions
+            _versions["stamp"] = _chunk_dir_stamp()
+        _notify_invalidation(None)
+    return list(_versions["versions"])
+
+def select_patch_versions(versions=None, since=None, until=None, last=None):
+    """
+    Picks the indexed patch versions to search, oldest first:
+    an explicit list, an inclusive range (since / until, either end open) and/or the `last` N patches.
+    """
+    available = list_patch_versions()
+    selected = [v for v in available if versions is None or v in versions]
+    if since:
+        selected = [v for v in selected if version_key(v) >= version_key(since)]
+    if until:
+        selected = [v for v in selected if version_key(v) <= version_key(until)]
+    if last:
+        selected = selected[-last:]
+    return selected
+
+def get_latest_patch_version():
+    """Returns the newest patch version available."""
+    versions = list_patch_versions()
+    if not versions:
+        raise ValueError("No patch collections found.")
+    return versions[-1]
+
+def get_latest_patch_collection():
+    """Retrieves the latest patch collection available."""
+    return get_collection_safe(f"patch_{get_latest_patch_version()}")
+
+def invalidate_collection_cache(name=None):
+    """
+    Drops cached collection handles (all of them, or only `name`) after a collection is rebuilt.
+    Other processes drop all of theirs on their next version lookup (see INVALIDATION_MARKER).
+    """
+    try:
+        with open(INVALIDATION_MARKER, "w", encoding="utf-8") as f:
+            f.write(str(time.time_ns()))
+    except OSError as e:
+        print(f"Could not touch {INVALIDATION_MARKER}: {e}")
+    with _lock:
+        if name is None:
+            _collections.clear()
+            _versions["stamp"] = None
+        else:
+            _collections.pop(name, None)
+        _versions["generation"] += 1
+    _notify_invalidation(name)
+
+def collection_cache_generation():
+    """Counter bumped every time cached handles are dropped, for caches built on top of this one."""
+    return _versions["generation"]
+
+def on_collection_invalidated(callback):
+    """Registers callback(name) to run when a collection is invalidated (name is None when all of them are)."""
+    _invalidation_listeners.append(callback)
+
+def _notify_invalidation(name):
+    for callback in list(_invalidation_listeners):
+        callback(name)
@@ -0,0 +1,153 @@
+# app/backend/entities.py
+import re
+import threading
+from collections import deque
+
+from app.backend.chroma import collection_cache_generation
+from app.backend.lexical import fold_text
+from app.chunking.chunk_store import iter_patch_chunks
+
+# Metadata fields set by chunk_from_riot_json that name the entity a chunk is about
+ENTITY_FIELDS = ("champion", "item", "rune")
+
+# Ability keys as players write them, mapped to the AZERTY keys of the French patch notes (Q = A, W = Z);
+# P stands for the passive. Single letters only count in upper case ("a" is also a French verb).
+ABILITY_KEYS = {"Q": "A", "A": "A", "W": "Z", "Z": "Z", "E": "E", "R": "R"}
+ABILITY_WORDS = {"passive": "P", "passif": "P", "ult": "R", "ulti": "R", "ultime": "R"}
+_ABILITY_KEY_RE = re.compile(r"(?<!\w)([QWERAZ])(?!\w)")
+
+def ability_key(ability: str):
+    """
+    (key, name) of an `ability` metadata value: "A - Dagues des Darkin" -> ("A", "Dagues des Darkin"),
+    "Compétence passive - Flammes" -> ("P", "Flammes"); (None, None) for other sections ("Stats de base").
+    """
+    prefix, _, name = (ability or "").partition(" - ")
+    if not name:
+        return None, None
+    if fold_text(prefix).strip() == "competence passive":
+        return "P", name
+    key = prefix.strip().upper()
+    return (key, name) if key in ("A", "Z", "E", "R") else (None, None)
+
+def ability_mentions(text: str):
+    """Ability keys named in text by key letter or word ("Brand's Q", "son passif"), as AZERTY keys."""
+    keys = {ABILITY_KEYS[letter] for letter in _ABILITY_KEY_RE.findall(text)}
+    keys.update(ABILITY_WORDS[word] for word in re.findall(r"\w+", fold_text(text)) if word in ABILITY_WORDS)
+    return keys
+
+# === AHO-CORASICK AUTOMATON ===
+class AhoCorasick:
+    """Multi-pattern matcher: finds every known name in a text in a single pass."""
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+    def add(self, pattern: str, value):
+        state = 0
+        for char in pattern:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.output[state].append((len(pattern), value))
+
+    def build(self):
+        """Computes the failure links (breadth-first); call once after adding every pattern."""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(char, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+        return self
+
+    def find(self, text: str):
+        """Yields (start, end, value) for every pattern occurrence in text."""
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, value in self.output[state]:
+                yield i - length + 1, i + 1, value
+
+# === ENTITY MATCHER ===
+class EntityMatcher:
+    """Detects the champions, items and runes (and ability names) of a patch mentioned in a question."""
+
+    def __init__(self, chunks):
+        self.automaton = AhoCorasick()
+        seen = set()
+        for chunk in chunks:
+            for field in ENTITY_FIELDS:
+                name = chunk["metadata"].get(field)
+                if name and (field, name) not in seen:
+                    seen.add((field, name))
+                    self.automaton.add(fold_text(name), (field, name))
+            key, name = ability_key(chunk["metadata"].get("ability"))
+            if key and ("ability", name) not in seen:
+                seen.add(("ability", name))
+                self.automaton.add(fold_text(name), ("ability", key))
+        self.automaton.build()
+
+    def _find(self, text: str):
+        """(field, value) of every known name in text (whole words only)."""
+        folded = fold_text(text)
+        for start, end, value in self.automaton.find(folded):
+            before = folded[start - 1] if start > 0 else " "
+            after = folded[end] if end < len(folded) else " "
+            if not (before.isalnum() or after.isalnum()):
+                yield value
+
+    def match(self, text: str):
+        """Returns {field: [names]} for the entities mentioned in text (whole words only)."""
+        entities = {}
+        for field, name in self._find(text):
+            if field in ENTITY_FIELDS and name not in entities.setdefault(field, []):
+                entities[field].append(name)
+        return entities
+
+    def match_abilities(self, text: str):
+        """AZERTY keys of the abilities mentioned in text, by key, word or ability name."""
+        keys = ability_mentions(text)
+        keys.update(key for field, key in self._find(text) if field == "ability")
+        return keys
+
+def build_where(entities):
+    """Turns detected entities into a Chroma `where` filter (None when nothing was detected)."""
+    clauses = [
+        {field: names[0]} if len(names) == 1 else {field: {"$in": names}}
+        for field, names in entities.items()
+    ]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+def matches_entities(metadata, entities):
+    """True when a chunk's metadata belongs to one of the detected entities."""
+    return any(metadata.get(field) in names for field, names in entities.items())
+
+_matchers = {}
+_lock = threading.Lock()
+
+def get_entity_matcher(version: str):
+    """Returns the entity matcher of a patch, built once from its chunk file."""
+    key = (version, collection_cache_generation())
+    matcher = _matchers.get(key)
+    if matcher is None:
+        with _lock:
+            matcher = _matchers.get(key)
+            if matcher is None:
+                matcher = EntityMatcher(iter_patch_chunks(version))
+                for old_key in [k for k in _matchers if k[0] == version]:
+                    del _matchers[old_key]
+                _matchers[key] = matcher
+    return matcher
@@ -0,0 +1,111 @@
+# app/backend/lexical.py
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+from app.backend.chroma import collection_cache_generation
+from app.chunking.chunk_patch_notes import chunk_id
+from app.chunking.chunk_store import iter_patch_chunks
+from app.config import BM25_B, BM25_K1
+
+# Words carrying no signal in our (French and English) patch-note chunks and questions
+STOPWORDS = {
+    "a", "an", "and", "are", "for", "in", "is", "of", "on", "the", "to", "was", "what", "with",
+    "au", "aux", "ce", "dans", "de", "des", "du", "en", "est", "et", "il", "la", "le", "les",
+    "pour", "qu", "que", "quoi", "sur", "un", "une",
+}
+
+def fold_text(text: str) -> str:
+    """Lowercases and strips accents, so 'Bâton séculaire' matches 'baton seculaire'."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+def tokenize(text: str):
+    """Folds and splits text into word tokens (champion/ability names survive intact)."""
+    return [token for token in re.findall(r"\w+", fold_text(text)) if len(token) > 1 and token not in STOPWORDS]
+
+# === BM25 INDEX ===
+class BM25Index:
+    """In-memory inverted index over chunks (any iterable, read once), scored with Okapi BM25."""
+
+    def __init__(self, chunks, k1: float = BM25_K1, b: float = BM25_B):
+        self.chunks = []
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)  # term -> [(chunk index, term frequency)]
+        self.doc_lengths = []
+
+        for i, chunk in enumerate(chunks):
+            self.chunks.append(chunk)
+            tokens = tokenize(chunk["text"])
+            self.doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings[term].append((i, tf))
+
+        n = len(self.chunks)
+        self.avg_length = sum(self.doc_lengths) / n if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def search(self, query: str, k: int = 10, metadata_filter=None):
+        """
+        Returns the top-k chunks for the query as (text, metadata, score) tuples.
+        metadata_filter(metadata) -> bool restricts the search to some chunks.
+        """
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                if metadata_filter and not metadata_filter(self.chunks[i]["metadata"]):
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[i] / self.avg_length)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.chunks[i]["text"], self.chunks[i]["metadata"], score) for i, score in top]
+
+_indexes = {}
+_lock = threading.Lock()
+
+def load_chunks(version: str):
+    """Loads the chunks of a patch from its chunk file (use iter_patch_chunks to stream them instead)."""
+    return list(iter_patch_chunks(version))
+
+def get_lexical_index(version: str):
+    """Returns the BM25 index of a patch, built once from its chunk file and kept in memory."""
+    key = (version, collection_cache_generation())
+    index = _indexes.get(key)
+    if index is None:
+        with _lock:
+            index = _indexes.get(key)
+            if index is None:
+                index = BM25Index(iter_patch_chunks(version))
+                # Drop indexes of chunk files that have been rewritten since
+                for old_key in [k for k in _indexes if k[0] == version]:
+                    del _indexes[old_key]
+                _indexes[key] = index
+    return index
+
+# === FUSION ===
+def reciprocal_rank_fusion(rankings, k: int = 60, limit: int = None):
+    """
+    Fuses several ranked result lists of (text, metadata, score) tuples with reciprocal rank fusion.
+    Results are matched by chunk ID; the first list wins for the returned tuple.
+    """
+    fused = defaultdict(float)
+    first_seen = {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking):
+            key = chunk_id({"text": result[0], "metadata": result[1]})
+            fused[key] += 1.0 / (k + rank + 1)
+            first_seen.setdefault(key, result)
+
+    ordered = sorted(fused, key=fused.get, reverse=True)
+    return [first_seen[key] for key in ordered[:limit]]
@@ -0,0 +1,106 @@
+# app/backend/metrics.py
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency buckets: from cache hits to long Ollama generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# === HISTOGRAMS ===
+class Histogram:
+    """Thread-safe cumulative histogram per label value, rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, help: str, label: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}  # label value -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(label_value, [0] * (len(self.buckets) + 1) + [0.0])
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {value: list(counts) for value, counts in self._series.items()}
+        for value, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {counts[-1]:.6f}')
+            lines.append(f'{self.name}_count{{{self.label}="{value}"}} {cumulative}')
+        return lines
+
+STAGE_SECONDS = Histogram(
+    "leaguegpt_stage_seconds", "Time spent in each stage of the RAG pipeline.", label="stage"
+)
+
+# === GAUGES AND COUNTERS (read from their owner at scrape time) ===
+_collectors = []
+
+def register_collector(collect):
+    """Registers a function returning [(name, type, help, {labels: value})] metrics, rendered on each scrape."""
+    _collectors.append(collect)
+
+def render_samples(name: str, kind: str, help: str, samples: dict):
+    """Lines of one gauge or counter; `samples` maps a tuple of (label, value) pairs to the sample value."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in sorted(samples.items()):
+        label_text = ",".join(f'{label}="{label_value}"' for label, label_value in labels)
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return lines
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = STAGE_SECONDS.render()
+    for collect in _collectors:
+        for name, kind, help, samples in collect():
+            lines += render_samples(name, kind, help, samples)
+    return "\n".join(lines) + "\n"
+
+# === PER-REQUEST TIMINGS ===
+class Timings:
+    """Stage durations of one request, in milliseconds (repeated stages add up)."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds * 1000
+
+    def as_dict(self):
+        return {stage: round(ms, 2) for stage, ms in self.stages.items()}
+
+_current = contextvars.ContextVar("rag_timings", default=None)
+
+@contextmanager
+def collect_timings():
+    """Collects the spans recorded by the current request (thread or task) into a Timings object."""
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+@contextmanager
+def span(stage: str):
+    """Times a pipeline stage: observed in the stage histogram and added to the current request's timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(stage, elapsed)
+        timings = _current.get()
+        if timings is not None:
+            timings.add(stage, elapsed)
@@ -0,0 +1,161 @@
+# app/backend/models.py
+import os
+import threading
+from types import SimpleNamespace
+from typing import List, Tuple
+
+from app.config import (
+    EMBED_MODEL, EMBED_BATCH_SIZE, INFERENCE_BACKEND, ONNX_MODEL_DIR, RERANK_MAX_LENGTH, RERANK_MODEL,
+    RERANK_MODEL_FAST, RERANK_TIER
+)
+
+INFERENCE_BACKENDS = ("torch", "int8", "onnx")
+
+# === MODEL REGISTRY (process-wide, lazy) ===
+_models = {}
+_lock = threading.Lock()
+
+def _get_or_load(key, loader):
+    """Returns the registered model for key, loading it once on first use."""
+    model = _models.get(key)
+    if model is None:
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                print(f"Loading model {key[1]} ({key[0]}, {key[2]})...")
+                model = loader()
+                _models[key] = model
+    return model
+
+# === INFERENCE BACKENDS ===
+class OnnxModel:
+    """
+    ONNX Runtime session behind the call interface of a transformers model:
+    model(**inputs) returns an object with `last_hidden_state` (embedder) or `logits` (reranker) as tensors.
+    """
+
+    def __init__(self, path: str, output_name: str):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.output_name = output_name
+
+    def __call__(self, **inputs):
+        import torch
+
+        feed = {name: inputs[name].numpy() for name in self.input_names if name in inputs}
+        output = self.session.run(None, feed)[0]
+        return SimpleNamespace(**{self.output_name: torch.from_numpy(output)})
+
+def export_onnx(model, tokenizer, path: str, output_name: str):
+    """Exports a transformers model to ONNX with dynamic batch and sequence axes."""
+    import torch
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    sample = tokenizer([("query", "passage")], return_tensors="pt")
+    input_names = list(sample.keys())
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes[output_name] = {0: "batch", 1: "sequence"} if output_name == "last_hidden_state" else {0: "batch"}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model, (dict(sample),), path + ".tmp",
+            input_names=input_names, output_names=[output_name], dynamic_axes=dynamic_axes, opset_version=14,
+        )
+    os.replace(path + ".tmp", path)
+
+def _load(model_class, name: str, backend: str, output_name: str):
+    """Loads a transformers model for an inference backend and returns the (tokenizer, model) pair."""
+    from transformers import AutoTokenizer
+
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r} (expected one of {INFERENCE_BACKENDS})")
+
+    tokenizer = AutoTokenizer.from_pretrained(name)
+    if backend == "onnx":
+        path = os.path.join(ONNX_MODEL_DIR, name.replace("/", "__") + ".onnx")
+        if not os.path.exists(path):
+            print(f"Exporting {name} to {path}...")
+            model = model_class.from_pretrained(name)
+            model.eval()
+            export_onnx(model, tokenizer, path, output_name)
+        return tokenizer, OnnxModel(path, output_name)
+
+    model = model_class.from_pretrained(name)
+    model.eval()
+    if backend == "int8":
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return tokenizer, model
+
+def get_embedder(name: str = EMBED_MODEL, backend: str = INFERENCE_BACKEND):
+    """Returns the (tokenizer, model) pair of the embedding model."""
+    def loader():
+        from transformers import AutoModel
+        return _load(AutoModel, name, backend, "last_hidden_state")
+    return _get_or_load(("embedder", name, backend), loader)
+
+def rerank_model_name(tier: str = RERANK_TIER) -> str:
+    """Cross-encoder used for a tier: "fast" (MiniLM-L-6) or "accurate" (MiniLM-L-12)."""
+    return RERANK_MODEL_FAST if tier == "fast" else RERANK_MODEL
+
+def get_reranker(name: str = None, backend: str = INFERENCE_BACKEND):
+    """Returns the (tokenizer, model) pair of the cross-encoder reranker (configured tier by default)."""
+    name = name or rerank_model_name()
+
+    def loader():
+        from transformers import AutoModelForSequenceClassification
+        return _load(AutoModelForSequenceClassification, name, backend, "logits")
+    return _get_or_load(("reranker", name, backend), loader)
+
+def loaded_models() -> List[Tuple[str, str, str]]:
+    """Lists the (kind, name, backend) of every model loaded in this process."""
+    return list(_models.keys())
+
+def warmup():
+    """Loads the embedder and the reranker ahead of the first request."""
+    get_embedder()
+    get_reranker()
+
+# === INFERENCE ===
+def embed_texts(texts: List[str], prefix: str = "passage: ", batch_size: int = EMBED_BATCH_SIZE,
+                backend: str = INFERENCE_BACKEND):
+    """
+    Embeds texts with the e5 model and returns a (len(texts), dim) float32 matrix of normalized vectors.
+    Texts are sorted by length before batching so each batch pads to similar lengths.
+    """
+    import numpy as np
+    import torch
+
+    tokenizer, model = get_embedder(backend=backend)
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    embeddings = [None] * len(texts)
+
+    for start in range(0, len(order), batch_size):
+        batch_idx = order[start:start + batch_size]
+        batch = [prefix + texts[i].strip() for i in batch_idx]
+        inputs = tokenizer(batch, return_tensors="pt", truncation=True, padding=True)
+        with torch.no_grad():
+            output = model(**inputs)
+            vectors = output.last_hidden_state[:, 0, :].numpy()
+        vectors = vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+        for i, vec in zip(batch_idx, vectors):
+            embeddings[i] = vec
+
+    return np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+
+def rerank_logits(pairs: List[Tuple[str, str]], max_length: int = RERANK_MAX_LENGTH, backend: str = INFERENCE_BACKEND):
+    """
+    Scores (query, document) pairs with the cross-encoder and returns the raw logits.
+    Pairs are capped to max_length tokens, which bounds the padded batch. "longest_first" trims the chunk for
+    normal questions and never fails on a query that alone is near the limit ("only_second" raises there).
+    """
+    import torch
+
+    tokenizer, model = get_reranker(backend=backend)
+    inputs = tokenizer(pairs, padding=True, truncation="longest_first", max_length=max_length, return_tensors="pt")
+    with torch.no_grad():
+        return model(**inputs).logits.squeeze(-1)
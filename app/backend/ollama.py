@@ -0,0 +1,96 @@
+# app/backend/ollama.py
+import json
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.config import (
+    LLM_MODEL, OLLAMA_CONNECT_TIMEOUT, OLLAMA_KEEP_ALIVE, OLLAMA_NUM_CTX, OLLAMA_POOL_SIZE, OLLAMA_TIMEOUT, OLLAMA_URL,
+    OLLAMA_WARMUP_TIMEOUT
+)
+
+# === POOLED SESSION ===
+_session = None
+
+def get_ollama_session():
+    """Returns the shared requests session to Ollama (pooled keep-alive connections)."""
+    global _session
+    if _session is None:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OLLAMA_POOL_SIZE)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _session = session
+    return _session
+
+def generate_payload(prompt: str, model: str = LLM_MODEL, stream: bool = False):
+    """
+    Body of an /api/generate request. keep_alive keeps the model loaded between bursts of questions,
+    and a fixed num_ctx avoids Ollama reloading the model when the context size changes.
+    """
+    return {
+        "model": model,
+        "prompt": prompt,
+        "stream": stream,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": {"num_ctx": OLLAMA_NUM_CTX},
+    }
+
+# === GENERATION ===
+def ask_ollama(prompt: str, model: str = LLM_MODEL):
+    """Sends a prompt to Ollama for response generation."""
+    try:
+        response = get_ollama_session().post(
+            f"{OLLAMA_URL}/api/generate", json=generate_payload(prompt, model),
+            timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_TIMEOUT),
+        )
+    except requests.RequestException as e:
+        return f"Error: Ollama request failed ({e})."
+    try:
+        data = response.json()
+        return data.get("response", "Error: No response field in Ollama response.").strip()
+    except Exception:
+        return "Error: Non-JSON response from Ollama."
+
+def ask_ollama_stream(prompt: str, model: str = LLM_MODEL):
+    """Streams the Ollama response token by token from its NDJSON output."""
+    payload = generate_payload(prompt, model, stream=True)
+    # The read timeout applies between two streamed lines, not to the whole answer
+    with get_ollama_session().post(
+        f"{OLLAMA_URL}/api/generate", json=payload, stream=True, timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_TIMEOUT)
+    ) as response:
+        for line in response.iter_lines():
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                yield "Error: Non-JSON response from Ollama."
+                return
+            if "error" in data:
+                yield f"Error: {data['error']}"
+                return
+            token = data.get("response", "")
+            if token:
+                yield token
+            if data.get("done"):
+                return
+
+def warm_ollama(model: str = LLM_MODEL, timeout: float = OLLAMA_WARMUP_TIMEOUT):
+    """Loads the model in Ollama ahead of the first question (a generate request without a prompt)."""
+    payload = {"model": model, "keep_alive": OLLAMA_KEEP_ALIVE, "options": {"num_ctx": OLLAMA_NUM_CTX}}
+    try:
+        get_ollama_session().post(
+            f"{OLLAMA_URL}/api/generate", json=payload, timeout=(OLLAMA_CONNECT_TIMEOUT, timeout)
+        ).raise_for_status()
+        return True
+    except requests.RequestException as e:
+        print(f"Could not preload {model} in Ollama: {e}")
+        return False
+
+def warm_ollama_in_background(model: str = LLM_MODEL):
+    """Starts warm_ollama in a daemon thread so startup never waits on Ollama."""
+    thread = threading.Thread(target=warm_ollama, args=(model,), name="warm-ollama", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,45 @@
+# app/backend/parents.py
+import threading
+
+from app.backend.chroma import collection_cache_generation
+from app.chunking.chunk_store import load_parents
+
+# === PARENT RECORDS (hierarchical chunking) ===
+_parents = {}
+_lock = threading.Lock()
+
+def get_parents(version: str) -> dict:
+    """Parent records of a patch by ID, read once from its parents file (empty for flat chunking)."""
+    key = (version, collection_cache_generation())
+    parents = _parents.get(key)
+    if parents is None:
+        with _lock:
+            parents = _parents.get(key)
+            if parents is None:
+                parents = load_parents(version)
+                for old_key in [k for k in _parents if k[0] == version]:
+                    del _parents[old_key]
+                _parents[key] = parents
+    return parents
+
+def expand_parents(documents, metadatas):
+    """
+    Prompt context for the selected chunks: child chunks are grouped under their parent record (champion summary
+    and context, included once), in the rank order of each group's best child. Chunks without a parent
+    (flat chunking, items, runes) are kept as they are.
+    """
+    blocks = []
+    groups = {}
+    for doc, meta in zip(documents, metadatas):
+        meta = meta or {}
+        pid = meta.get("parent_id")
+        parent = get_parents(meta.get("patch_version")).get(pid) if pid else None
+        if parent is None:
+            blocks.append(doc)
+            continue
+        if pid not in groups:
+            groups[pid] = [parent["text"]]
+            blocks.append(groups[pid])
+        if meta.get("type") != "summary":  # the parent already holds the summary
+            groups[pid].append(f"- {doc}")
+    return [block if isinstance(block, str) else "\n".join(block) for block in blocks]
@@ -0,0 +1,114 @@
+# app/backend/prompting.py
+import math
+import re
+from typing import List
+
+from app.config import (
+    FOLLOWUP_MAX_WORDS, HISTORY_MAX_TURNS, HISTORY_TOKEN_BUDGET, HISTORY_TURN_MAX_TOKENS, PROMPT_TOKEN_BUDGET
+)
+
+# Mistral's tokenizer produces roughly 1.3 tokens per French/English word, plus one per punctuation mark
+TOKENS_PER_WORD = 1.3
+
+# === TOKEN COUNTING ===
+def count_tokens(text: str) -> int:
+    """Cheap estimate of the number of LLM tokens in text (no tokenizer load)."""
+    words = len(re.findall(r"\w+", text))
+    punctuation = len(re.findall(r"[^\w\s]", text))
+    return math.ceil(words * TOKENS_PER_WORD) + punctuation
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text to about max_tokens, on a word boundary."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    keep = max(1, int(max_tokens / (TOKENS_PER_WORD + 0.3)))
+    return " ".join(words[:keep]) + " [...]"
+
+# === HISTORY ===
+def trim_history(history: List[dict], budget: int = HISTORY_TOKEN_BUDGET, max_turns: int = HISTORY_MAX_TURNS):
+    """
+    Keeps the most recent turns that fit in the token budget (each turn capped to HISTORY_TURN_MAX_TOKENS),
+    so the prompt does not grow with the length of the conversation.
+    """
+    kept = []
+    used = 0
+    for msg in reversed((history or [])[-max_turns:]):
+        content = truncate_to_tokens(msg.get("content", ""), HISTORY_TURN_MAX_TOKENS)
+        cost = count_tokens(content) + 2
+        if used + cost > budget:
+            break
+        kept.append({"role": msg.get("role"), "content": content})
+        used += cost
+    return list(reversed(kept))
+
+def rewrite_query(question: str, history: List[dict] = None) -> str:
+    """
+    Text embedded for retrieval: the current question only, prefixed with the previous user question
+    when it is a short follow-up ("and his W?") that cannot be searched on its own.
+    """
+    if not history or len(question.split()) > FOLLOWUP_MAX_WORDS:
+        return question
+    previous = [msg["content"] for msg in history if msg.get("role") == "user" and msg.get("content")]
+    if not previous or previous[-1].strip() == question.strip():
+        return question
+    return f"{truncate_to_tokens(previous[-1], HISTORY_TURN_MAX_TOKENS)} {question}"
+
+# === CHUNKS ===
+def dedupe_chunks(chunks: List[str]) -> List[str]:
+    """Drops repeated chunks (same text once whitespace and case are folded), keeping the first occurrence."""
+    seen = set()
+    unique = []
+    for chunk in chunks:
+        key = re.sub(r"\s+", " ", chunk.strip().lower())
+        if key not in seen:
+            seen.add(key)
+            unique.append(chunk)
+    return unique
+
+def fit_chunks(chunks: List[str], budget: int) -> List[str]:
+    """Keeps chunks in rank order while they fit in the token budget (always at least one, truncated)."""
+    kept = []
+    used = 0
+    for chunk in chunks:
+        cost = count_tokens(chunk) + 3  # separator
+        if used + cost > budget:
+            if not kept:
+                kept.append(truncate_to_tokens(chunk, budget))
+            break
+        kept.append(chunk)
+        used += cost
+    return kept
+
+# === PROMPT ===
+# Fixed instructions come first and never change between requests, so Ollama can reuse the evaluated
+# prefix of the previous prompt; only the excerpts, history and question that follow are new.
+SYSTEM_PROMPT = """You are a League of Legends expert.
+You are given excerpts from recent patch notes and the previous conversation.
+Based only on this context and previous conversation, clearly, concisely, and structurally answer the question.
+If you don't have enough information, state this clearly."""
+
+PROMPT_TEMPLATE = """{system}
+
+Here are some excerpts from recent patch notes:
+
+{context}
+
+{history}
+
+Question: {question}
+"""
+
+def build_prompt(chunks: list, question: str, history: List[dict] = None, budget: int = PROMPT_TOKEN_BUDGET):
+    """
+    Builds a prompt for Ollama based on retrieved chunks and conversation history, within a token budget:
+    history is trimmed to its own share first, then deduplicated chunks fill what is left.
+    The prompt always starts with SYSTEM_PROMPT (stable prefix).
+    """
+    turns = trim_history(history)
+    history_text = "\n\n".join(f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}" for msg in turns)
+
+    fixed = count_tokens(SYSTEM_PROMPT) + count_tokens(PROMPT_TEMPLATE) + count_tokens(question) + count_tokens(history_text)
+    context = "\n\n---\n\n".join(fit_chunks(dedupe_chunks(chunks), max(budget - fixed, 0)))
+
+    return PROMPT_TEMPLATE.format(system=SYSTEM_PROMPT, context=context, history=history_text, question=question).strip()
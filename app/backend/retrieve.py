@@ -1,96 +1,247 @@
 # app/backend/retrieve.py
-import chromadb
 import numpy as np
-from transformers import AutoTokenizer, AutoModel, AutoModelForSequenceClassification
-import torch
 from collections import defaultdict
-import torch.nn.functional as F
-import requests
-from app.config import CHROMA_DIR, EMBED_MODEL, RERANK_MODEL, get_chroma_host
+from concurrent.futures import ThreadPoolExecutor
+from app.backend.batching import MicroBatcher
+from app.backend.chroma import (
+    get_collection_safe, get_latest_patch_version, on_collection_invalidated, refresh_collection
+)
+from app.backend.entities import ability_mentions, build_where, get_entity_matcher, matches_entities
+from app.backend.lexical import get_lexical_index, reciprocal_rank_fusion
+from app.backend.metrics import register_collector, span
+from app.backend.ollama import ask_ollama, ask_ollama_stream
+from app.backend.parents import expand_parents
+from app.backend.cache import AnswerCache, LRUCache, SemanticCache, answer_cache_key, normalize_query
+from app.backend.models import embed_texts, rerank_logits
+from app.backend.prompting import build_prompt, rewrite_query
+from app.config import (
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ENTITY_FILTER, HYBRID_RETRIEVAL, MICRO_BATCHING, MICRO_BATCH_MAX_SIZE, MICRO_BATCH_MAX_WAIT_MS,
+    MULTI_PATCH_WORKERS, QUERY_CACHE_SIZE, RERANK_SKIP_MARGIN, RRF_K, SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD
+)
 from typing import List, Tuple
 
 # === CONFIGURATION ===
 COLLECTION_NAME = "patch_chunks"
 
-# === EMBEDDING MODEL (E5 base) ===
-embed_tokenizer = AutoTokenizer.from_pretrained(EMBED_MODEL)
-embed_model = AutoModel.from_pretrained(EMBED_MODEL)
-
-# === RERANKER MODEL (MiniLM) ===
-rerank_tokenizer = AutoTokenizer.from_pretrained(RERANK_MODEL)
-rerank_model = AutoModelForSequenceClassification.from_pretrained(RERANK_MODEL)
+# Models (e5 embedder, MiniLM reranker) are loaded lazily by app.backend.models
 
 # === CONVERSATION MEMORY (ephemeral) ===
 conversation_history: List[Tuple[str, str]] = []  # (user_message, bot_response)
 
-# === CHROMA CLIENT ===
-def get_collection_safe(name):
-    """Safely retrieves a Chroma collection by name."""
-    host, port = get_chroma_host()
-    client = chromadb.HttpClient(host=host, port=port)
-    try:
-        return client.get_collection(name=name)
-    except Exception as e:
-        print(f"Error retrieving collection {name}: {e}")
-        return None
-
-def get_latest_patch_collection():
-    """Retrieves the latest patch collection available."""
-    import os
-    from app.config import CHUNK_DIR
-
-    files = [f for f in os.listdir(CHUNK_DIR) if f.startswith("chunks_") and f.endswith(".json")]
-    if not files:
-        raise ValueError("No patch collections found.")
-
-    versions = [f.replace("chunks_", "").replace(".json", "") for f in files]
-    latest_version = sorted(versions, reverse=True)[0]
-
-    print(f"Using the latest patch: {latest_version}")
-    return get_collection_safe(f"patch_{latest_version}")
+# === MICRO-BATCHING (concurrent requests share one forward pass) ===
+embed_batcher = MicroBatcher(
+    lambda texts: embed_texts(texts, prefix="query: ", batch_size=len(texts)),
+    max_batch=MICRO_BATCH_MAX_SIZE, max_wait_ms=MICRO_BATCH_MAX_WAIT_MS, name="embed"
+)
+rerank_batcher = MicroBatcher(
+    lambda pairs: rerank_logits(pairs).reshape(-1).tolist(),
+    max_batch=MICRO_BATCH_MAX_SIZE, max_wait_ms=MICRO_BATCH_MAX_WAIT_MS, name="rerank"
+)
+
+def micro_batch_stats():
+    """Returns the queue-depth and batch-size metrics of the embed and rerank batchers."""
+    return {"embed": embed_batcher.stats(), "rerank": rerank_batcher.stats()}
+
+def _batcher_metrics():
+    """Micro-batcher metrics exported on /api/metrics/."""
+    by_batcher = micro_batch_stats()
+    stats = {(("batcher", name),): batcher_stats for name, batcher_stats in by_batcher.items()}
+    batch_sizes = {
+        (("batcher", name), ("size", size)): count
+        for name, batcher_stats in by_batcher.items() for size, count in batcher_stats["batch_sizes"].items()
+    }
+    return [
+        ("leaguegpt_microbatch_queue_depth", "gauge", "Requests waiting for the next forward pass.",
+         {labels: s["queue_depth"] for labels, s in stats.items()}),
+        ("leaguegpt_microbatch_max_queue_depth", "gauge", "Highest queue depth seen since startup.",
+         {labels: s["max_queue_depth"] for labels, s in stats.items()}),
+        ("leaguegpt_microbatch_batches_total", "counter", "Forward passes run by each batcher.",
+         {labels: s["batches"] for labels, s in stats.items()}),
+        ("leaguegpt_microbatch_items_total", "counter", "Requests served by each batcher (items / batches = mean batch size).",
+         {labels: s["items"] for labels, s in stats.items()}),
+        ("leaguegpt_microbatch_batch_size_total", "counter", "Forward passes per batch size.", batch_sizes),
+    ]
+
+register_collector(_batcher_metrics)
 
 # === EMBEDDING ===
+query_embedding_cache = LRUCache(maxsize=QUERY_CACHE_SIZE)
+
 def normalize(vec):
     """Normalizes embedding vectors."""
     return vec / np.linalg.norm(vec)
 
 def embed_query(text: str):
-    """Embeds a query text into a normalized vector."""
-    text = "query: " + text.strip()
-    inputs = embed_tokenizer(text, return_tensors="pt", truncation=True, padding=True)
-    with torch.no_grad():
-        output = embed_model(**inputs)
-        embeddings = output.last_hidden_state[:, 0, :]
-        return normalize(embeddings.squeeze().numpy())
+    """Embeds a query text into a normalized vector, reusing cached vectors for repeated questions."""
+    key = normalize_query(text)
+    embedding = query_embedding_cache.get(key)
+    if embedding is None:
+        if MICRO_BATCHING:
+            embedding = embed_batcher.submit(text).result()
+        else:
+            embedding = embed_texts([text], prefix="query: ")[0]
+        embedding.setflags(write=False)  # shared between callers
+        query_embedding_cache.set(key, embedding)
+    return embedding
 
 # === SEARCH ===
-def search_chunks(user_query, collection, k=10):
-    """Searches for relevant chunks based on the user's query."""
+_patch_search_pool = ThreadPoolExecutor(max_workers=MULTI_PATCH_WORKERS, thread_name_prefix="patch-search")
+
+def search_chunks(user_query, collection, k=10, where=None):
+    """Searches for relevant chunks based on the user's query, optionally restricted by a metadata filter."""
     query_embedding = embed_query(user_query)
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=k,
-        include=["documents", "metadatas", "distances"]
+    query = dict(
+        query_embeddings=[query_embedding], n_results=k, where=where, include=["documents", "metadatas", "distances"]
     )
+    try:
+        results = collection.query(**query)
+    except Exception as e:
+        # A stale handle (collection rebuilt under a new id): fetch the collection again and retry once
+        fresh = refresh_collection(collection.name)
+        if fresh is None or fresh is collection:
+            raise
+        print(f"Query on {collection.name} failed ({e}), retrying with a fresh handle")
+        results = fresh.query(**query)
     return list(zip(results["documents"][0], results["metadatas"][0], results["distances"][0]))
 
-# === RERANKING ===
-def rerank_chunks(query: str, documents: list[str], metadatas: list[dict], top_k=5, score_gap=0.05, debug=False):
-    """Re-ranks retrieved chunks using a reranker model to improve relevance."""
-    documents = [doc for doc in documents if isinstance(doc, str) and doc.strip()]
-    if not documents:
+def detect_entities(user_query, version):
+    """Returns the champions / items / runes of the patch named in the query, as {field: [names]}."""
+    if not ENTITY_FILTER:
+        return {}
+    try:
+        return get_entity_matcher(version).match(user_query)
+    except FileNotFoundError:
+        return {}
+
+def filtered_search(user_query, collection, version, k=10):
+    """
+    Dense search restricted to the entities named in the question, falling back to the whole collection
+    when nothing is detected or matches. Returns (results, entities actually used).
+    """
+    entities = detect_entities(user_query, version)
+    if entities:
+        try:
+            results = search_chunks(user_query, collection, k=k, where=build_where(entities))
+            if results:
+                return results, entities
+        except Exception as e:
+            print(f"Filtered search failed ({e}), falling back to the whole collection")
+    return search_chunks(user_query, collection, k=k), {}
+
+def search_patch(user_query, collection, version, k=10):
+    """First-stage retrieval for one patch: entity-filtered dense search fused with BM25 results."""
+    results, entities = filtered_search(user_query, collection, version, k=k)
+    return fuse_lexical(user_query, results, version, k=k, entities=entities)
+
+def search_patches(user_query, versions, k=10):
+    """
+    Searches several patch collections concurrently (one round instead of one query per patch).
+    Dense results are merged by distance (same embedder, comparable across patches); BM25 scores are not
+    comparable across patch indexes, so each patch's lexical ranking is fused on its own with the merged
+    dense ranking (reciprocal rank fusion). Each result keeps its `patch_version` metadata.
+    """
+    # Embed once up front: the concurrent searches then hit the query cache
+    embed_query(user_query)
+
+    def search_one(version):
+        collection = get_collection_safe(f"patch_{version}")
+        if not collection:
+            return [], []
+        results, entities = filtered_search(user_query, collection, version, k=k)
+        return results, lexical_search(user_query, version, k=k, entities=entities)
+
+    return merge_patch_results(versions, _patch_search_pool.map(search_one, versions), k=k)
+
+def merge_patch_results(versions, per_patch, k=10):
+    """Merges the (dense, lexical) results of each patch of search_patches, tagging them with `patch_version`."""
+    dense, lexical = [], []
+    for version, (dense_results, lexical_results) in zip(versions, per_patch):
+        for _, meta, _ in dense_results:
+            meta.setdefault("patch_version", version)
+        dense.extend(dense_results)
+        if lexical_results:
+            # Copies: the lexical index metadata is shared between requests
+            lexical.append([(doc, {"patch_version": version, **meta}, dist) for doc, meta, dist in lexical_results])
+    dense.sort(key=lambda result: result[2])
+    if not lexical:
+        return dense[:k]
+    return reciprocal_rank_fusion([dense] + lexical, k=RRF_K, limit=k)
+
+def lexical_search(user_query, version, k=10, entities=None):
+    """
+    BM25 results of a patch as (text, metadata, None) tuples: BM25 scores are not distances, so chunks
+    only found lexically carry no dense distance. Empty when hybrid retrieval is off or the patch has no chunk file.
+    """
+    if not HYBRID_RETRIEVAL:
+        return []
+    metadata_filter = (lambda meta: matches_entities(meta, entities)) if entities else None
+    try:
+        lexical_results = get_lexical_index(version).search(user_query, k=k, metadata_filter=metadata_filter)
+    except FileNotFoundError:
         return []
+    return [(doc, meta, None) for doc, meta, _ in lexical_results]
 
-    pairs = [(query, doc) for doc in documents]
-    inputs = rerank_tokenizer(pairs, padding=True, truncation=True, return_tensors="pt")
-    with torch.no_grad():
-        scores = rerank_model(**inputs).logits.squeeze()
+def fuse_lexical(user_query, dense_results, version, k=10, entities=None):
+    """
+    Fuses dense results with BM25 results over the patch chunks (reciprocal rank fusion),
+    so exact champion / ability / item names are found even when the embedding misses them.
+    """
+    lexical_results = lexical_search(user_query, version, k=k, entities=entities)
+    if not lexical_results:
+        return dense_results
+    return reciprocal_rank_fusion([dense_results, lexical_results], k=RRF_K, limit=k)
+
+# === RERANKING ===
+def dense_winner_scores(distances, margin=RERANK_SKIP_MARGIN):
+    """
+    Cosine similarities of the candidates when the dense search already has a clear winner
+    (best similarity ahead of the runner-up by `margin`), else None.
+    The check uses the dense ranking only: candidates added by BM25 fusion (distance None) were outside
+    the dense top-k, so they are scored with the lowest dense similarity instead of disabling the check.
+    """
+    # squared L2 between normalized vectors
+    dense = sorted((1.0 - d / 2.0 for d in distances if d is not None), reverse=True)
+    if margin <= 0 or len(dense) < 2 or dense[0] - dense[1] < margin:
+        return None
+    return [1.0 - d / 2.0 if d is not None else dense[-1] for d in distances]
 
-    probs = F.softmax(scores, dim=-1)
-    if probs.ndim == 0:
-        probs = probs.unsqueeze(0)
+def cross_encoder_scores(query: str, documents: list[str]):
+    """Calibrated per-pair relevance in [0, 1] (sigmoid of the cross-encoder logit), comparable across queries."""
+    import torch
 
-    scored = list(zip(documents, metadatas, probs.tolist()))
+    pairs = [(query, doc) for doc in documents]
+    if MICRO_BATCHING:
+        logits = torch.tensor(rerank_batcher.map(pairs))
+    else:
+        logits = rerank_logits(pairs)
+    return torch.sigmoid(logits.reshape(-1)).tolist()
+
+def rerank_chunks(query: str, documents: list[str], metadatas: list[dict], top_k=5, score_gap=0.05, debug=False, distances=None):
+    """
+    Re-ranks retrieved chunks using a reranker model to improve relevance.
+    Returned scores are cross-encoder probabilities (sigmoid), except when the dense `distances` already show
+    a clear winner: the cross-encoder is then skipped and the scores are cosine similarities.
+    """
+    distances = distances if distances is not None else [None] * len(documents)
+    kept = [
+        (doc, meta, dist) for doc, meta, dist in zip(documents, metadatas, distances)
+        if isinstance(doc, str) and doc.strip()
+    ]
+    if not kept:
+        return []
+    documents, metadatas, distances = (list(column) for column in zip(*kept))
+
+    scores = dense_winner_scores(distances)
+    if scores is not None:
+        # Cosines are not on the sigmoid scale score_gap was tuned for: the winner leads by at least
+        # RERANK_SKIP_MARGIN, so a gap no larger than that keeps it alone (unless grouped by champion below)
+        score_gap = min(score_gap, RERANK_SKIP_MARGIN)
+        if debug:
+            print("Rerank skipped: clear dense winner")
+    else:
+        scores = cross_encoder_scores(query, documents)
+
+    scored = list(zip(documents, metadatas, scores))
     scored.sort(key=lambda x: x[2], reverse=True)
 
     grouped = defaultdict(list)
@@ -113,58 +264,183 @@ def rerank_chunks(query: str, documents: list[str], metadatas: list[dict], top_k
 
     return [(doc, score) for doc, _, score in selected[:top_k]]
 
-# === PROMPTING + GENERATION (Ollama) ===
-def build_prompt(chunks: list, question: str, history: List[dict] = None):
-    """Builds a prompt for Ollama based on retrieved chunks and conversation history."""
-    context = "\n\n---\n\n".join(chunks)
-
-    history_text = ""
-    if history:
-        turns = [f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}" for msg in history]
-        history_text = "\n\n".join(turns)
-
-    prompt = f"""
-    You are a League of Legends expert.
-
-    Here are some excerpts from recent patch notes:
-
-    {context}
-
-    {history_text}
-
-    Based only on this context and previous conversation, clearly, concisely, and structurally answer:
-
-    {question}
-
-    If you don't have enough information, state this clearly.
-    """
-    return prompt.strip()
-
-def ask_ollama(prompt: str, model: str = "mistral"):
-    """Sends a prompt to Ollama for response generation."""
-    response = requests.post("http://ollama:11434/api/generate", json={"model": model, "prompt": prompt, "stream": False})
-    try:
-        data = response.json()
-        return data.get("response", "Error: No response field in Ollama response.").strip()
-    except Exception:
-        return "Error: Non-JSON response from Ollama."
-
 # === COMPLETE PIPELINE ===
-def generate_answer(question: str, n_chunks=10, top_k=3, history: List[dict] = None):
-    """Generates an answer by retrieving, reranking, and generating responses."""
-    collection = get_latest_patch_collection()
-    if not collection:
-        return "No data available to answer this question."
-
-    raw = search_chunks(question, collection=collection, k=n_chunks)
+NO_DATA_ANSWER = "No data available to answer this question."
+
+# Generated answers, keyed on (patch versions, normalized question, selected chunks, history)
+answer_cache = AnswerCache(maxsize=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
+
+# Answers of earlier questions with the same meaning (questions without conversation history only)
+semantic_cache = SemanticCache(maxsize=SEMANTIC_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, threshold=SEMANTIC_CACHE_THRESHOLD)
+on_collection_invalidated(lambda name: semantic_cache.invalidate(name[len("patch_"):] if name else None))
+
+def _cache_metrics():
+    """Hit/miss counters of the query embedding and semantic caches, exported on /api/metrics/."""
+    stats = {(("cache", "query_embedding"),): query_embedding_cache.stats(), (("cache", "semantic"),): semantic_cache.stats()}
+    return [
+        ("leaguegpt_cache_hits_total", "counter", "Lookups answered from the cache.",
+         {labels: s["hits"] for labels, s in stats.items()}),
+        ("leaguegpt_cache_misses_total", "counter", "Lookups that missed the cache.",
+         {labels: s["misses"] for labels, s in stats.items()}),
+        ("leaguegpt_cache_entries", "gauge", "Entries currently held by the cache.",
+         {labels: s["size"] for labels, s in stats.items()}),
+    ]
+
+register_collector(_cache_metrics)
+
+def semantic_scope(question: str, versions: List[str]):
+    """
+    Scope in which two questions may share an answer: the same patches, the same named entities and
+    the same abilities ("is Ahri buffed?" and "is Brand buffed?", or "Brand's Q" and "Brand's W",
+    embed closely but must not share an answer).
+    """
+    entities = {("ability", key) for key in ability_mentions(question)}
+    for version in versions:
+        try:
+            matcher = get_entity_matcher(version)
+        except FileNotFoundError:
+            continue
+        matched = matcher.match(question)
+        entities.update((field, name) for field, names in matched.items() for name in names)
+        entities.update(("ability", key) for key in matcher.match_abilities(question))
+    return tuple(versions), tuple(sorted(entities))
+
+def resolve_versions(versions: List[str] = None):
+    """The patch versions a question is answered from (the latest patch by default)."""
+    return list(versions) if versions else [get_latest_patch_version()]
+
+def retrieve_context(question: str, n_chunks=10, versions: List[str] = None, embedded: bool = False):
+    """
+    Retrieves and reranks the chunks used to answer a question (None when no collection is available),
+    expanded with their parent records when the patch was chunked hierarchically.
+    By default only the latest patch is searched; pass several versions for history questions.
+    embedded=True means the caller already embedded (and timed) this exact query, so "embed" is recorded once.
+    """
+    versions = resolve_versions(versions)
+    if not embedded:
+        with span("embed"):
+            embed_query(question)  # the searches below then hit the query cache
+
+    with span("search"):
+        if len(versions) > 1:
+            raw = search_patches(question, versions, k=n_chunks)
+        else:
+            version = versions[0]
+            collection = get_collection_safe(f"patch_{version}")
+            raw = search_patch(question, collection, version, k=n_chunks) if collection else None
+    if not raw:
+        return None
     docs = [doc for doc, _, _ in raw]
     metas = [meta for _, meta, _ in raw]
+    distances = [dist for _, _, dist in raw]
 
-    top_docs = rerank_chunks(question, docs, metas, top_k=7)
-    top_texts = [doc for doc, _ in top_docs]
+    with span("rerank"):
+        top_docs = rerank_chunks(question, docs, metas, top_k=7, distances=distances)
 
-    prompt = build_prompt(top_texts, question, history=history)
-    response = ask_ollama(prompt)
+    # Hierarchical chunks: add each champion's summary and context once, next to its selected changes
+    meta_by_doc = dict(zip(docs, metas))
+    return expand_parents([doc for doc, _ in top_docs], [meta_by_doc.get(doc) for doc, _ in top_docs])
 
+# === ANSWER CACHES (shared by generate_answer, generate_answer_stream and agenerate_answer) ===
+def lookup_semantic_answer(question: str, vector, versions: List[str]):
+    """
+    Pre-generation lookup for a question without history: returns (scope, answer of a close earlier
+    question or None). A hit is recorded in the conversation history.
+    """
+    scope = semantic_scope(question, versions)
+    cached = semantic_cache.get(vector, scope)
+    if cached is not None:
+        conversation_history.append((question, cached))
+    return scope, cached
+
+def lookup_cached_answer(question: str, top_texts: List[str], versions: List[str], history: List[dict] = None):
+    """Answer-cache lookup once the chunks are known: returns (cache key, cached answer or None)."""
+    cache_key = answer_cache_key(versions, question, top_texts, history)
+    return cache_key, answer_cache.get(cache_key)
+
+def store_answer(question: str, response: str, versions: List[str], vector=None, scope=None, cache_key=None,
+                 failed: bool = None):
+    """
+    Post-generation store: a successful answer goes to the answer cache (when cache_key is given) and to the
+    semantic cache (when the question had a scope), then the exchange is added to the conversation history.
+    Ollama failures are answers starting with "Error"; pass `failed` when the error came after streamed tokens.
+    Returns the response.
+    """
+    if failed is None:
+        failed = response.startswith("Error")
+    if response and not failed:
+        if cache_key is not None:
+            answer_cache.set(cache_key, response)
+        if scope is not None:
+            semantic_cache.set(vector, scope, response, versions)
     conversation_history.append((question, response))
     return response
+
+def generate_answer(question: str, n_chunks=10, top_k=3, history: List[dict] = None, versions: List[str] = None):
+    """
+    Generates an answer by retrieving, reranking, and generating responses.
+    Each stage is timed (app.backend.metrics), including the whole call as "total".
+    """
+    with span("total"):
+        versions = resolve_versions(versions)
+        vector = scope = None
+        if not history:
+            with span("embed"):
+                vector = embed_query(question)
+            scope, cached = lookup_semantic_answer(question, vector, versions)
+            if cached is not None:
+                return cached
+
+        top_texts = retrieve_context(
+            rewrite_query(question, history), n_chunks=n_chunks, versions=versions, embedded=scope is not None
+        )
+        if top_texts is None:
+            return NO_DATA_ANSWER
+
+        cache_key, cached = lookup_cached_answer(question, top_texts, versions, history)
+        if cached is not None:
+            return store_answer(question, cached, versions, vector, scope)
+
+        with span("prompt"):
+            prompt = build_prompt(top_texts, question, history=history)
+        with span("generate"):
+            response = ask_ollama(prompt)
+        return store_answer(question, response, versions, vector, scope, cache_key=cache_key)
+
+def generate_answer_stream(question: str, n_chunks=10, top_k=3, history: List[dict] = None, versions: List[str] = None):
+    """Same pipeline as generate_answer, but yields the answer token by token as Ollama produces it."""
+    versions = resolve_versions(versions)
+    vector = scope = None
+    if not history:
+        with span("embed"):
+            vector = embed_query(question)
+        scope, cached = lookup_semantic_answer(question, vector, versions)
+        if cached is not None:
+            yield cached
+            return
+
+    top_texts = retrieve_context(
+        rewrite_query(question, history), n_chunks=n_chunks, versions=versions, embedded=scope is not None
+    )
+    if top_texts is None:
+        yield NO_DATA_ANSWER
+        return
+
+    cache_key, cached = lookup_cached_answer(question, top_texts, versions, history)
+    if cached is not None:
+        yield store_answer(question, cached, versions, vector, scope)
+        return
+
+    with span("prompt"):
+        prompt = build_prompt(top_texts, question, history=history)
+    tokens = []
+    with span("generate"):
+        for token in ask_ollama_stream(prompt):
+            tokens.append(token)
+            yield token
+
+    # Ollama errors arrive as the last token, possibly after part of the answer: never cache those
+    store_answer(
+        question, "".join(tokens).strip(), versions, vector, scope, cache_key=cache_key,
+        failed=bool(tokens) and tokens[-1].startswith("Error")
+    )
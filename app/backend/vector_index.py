@@ -0,0 +1,123 @@
+# app/backend/vector_index.py
+import json
+import os
+import threading
+
+import numpy as np
+from app.config import VECTOR_INDEX_DIR
+
+# === ON-DISK FORMAT ===
+# <VECTOR_INDEX_DIR>/<collection>.npy   contiguous float32 (n, dim) matrix of normalized embeddings
+# <VECTOR_INDEX_DIR>/<collection>.json  ids, documents and metadatas, row-aligned with the matrix
+
+def _paths(name):
+    return os.path.join(VECTOR_INDEX_DIR, f"{name}.npy"), os.path.join(VECTOR_INDEX_DIR, f"{name}.json")
+
+def write_vector_index(name, ids, embeddings, documents, metadatas):
+    """Writes a collection snapshot that LocalCollection can memory-map (written atomically)."""
+    os.makedirs(VECTOR_INDEX_DIR, exist_ok=True)
+    matrix_path, records_path = _paths(name)
+
+    with open(matrix_path + ".tmp", "wb") as f:
+        np.save(f, np.ascontiguousarray(embeddings, dtype=np.float32))
+    with open(records_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"ids": list(ids), "documents": list(documents), "metadatas": list(metadatas)}, f, ensure_ascii=False)
+
+    os.replace(matrix_path + ".tmp", matrix_path)
+    os.replace(records_path + ".tmp", records_path)
+
+def has_vector_index(name):
+    """True when both files of the collection snapshot exist."""
+    return all(os.path.exists(path) for path in _paths(name))
+
+def _matches(metadata, where):
+    """Evaluates the subset of Chroma `where` filters we use: equality, $eq, $in, $ne, $nin, $and, $or."""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                if op == "$eq" and value != operand:
+                    return False
+                if op == "$ne" and value == operand:
+                    return False
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$nin" and value in operand:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+# === IN-PROCESS COLLECTION ===
+class LocalCollection:
+    """
+    Read-only, in-process stand-in for a Chroma collection.
+    Answers `query` with one matrix-vector product over a memory-mapped matrix plus argpartition,
+    and returns the same result layout as Chroma (squared L2 distances, like Chroma's default space).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        matrix_path, records_path = _paths(name)
+        self.embeddings = np.load(matrix_path, mmap_mode="r")
+        with open(records_path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        self.ids = records["ids"]
+        self.documents = records["documents"]
+        self.metadatas = records["metadatas"]
+
+    def count(self):
+        return len(self.ids)
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        candidates = None
+        if where:
+            candidates = np.array([i for i, meta in enumerate(self.metadatas) if _matches(meta, where)], dtype=np.int64)
+
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query in query_embeddings:
+            query = np.asarray(query, dtype=np.float32)
+            if candidates is None:
+                rows = np.arange(len(self.ids))
+                similarities = self.embeddings @ query
+            else:
+                rows = candidates
+                similarities = self.embeddings[candidates] @ query if len(candidates) else np.empty(0, dtype=np.float32)
+
+            k = min(n_results, len(rows))
+            if k == 0:
+                top = np.empty(0, dtype=np.int64)
+            else:
+                top = np.argpartition(-similarities, k - 1)[:k]
+                top = top[np.argsort(-similarities[top])]
+
+            selected = rows[top]
+            result["ids"].append([self.ids[i] for i in selected])
+            result["documents"].append([self.documents[i] for i in selected])
+            result["metadatas"].append([self.metadatas[i] for i in selected])
+            # |q - d|^2 = 2 - 2 cos for normalized vectors
+            result["distances"].append((2.0 - 2.0 * similarities[top]).tolist())
+        return result
+
+_collections = {}
+_lock = threading.Lock()
+
+def get_local_collection(name):
+    """Returns the in-process collection for name (reloaded when its files are rewritten), or None."""
+    matrix_path, _ = _paths(name)
+    if not os.path.exists(matrix_path):
+        print(f"No local vector index for {name} in {VECTOR_INDEX_DIR}")
+        return None
+    stamp = os.stat(matrix_path).st_mtime_ns
+    cached = _collections.get(name)
+    if cached is None or cached[0] != stamp:
+        with _lock:
+            cached = (stamp, LocalCollection(name))
+            _collections[name] = cached
+    return cached[1]
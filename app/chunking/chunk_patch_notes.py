@@ -1,5 +1,14 @@
 import os
 import json
+import hashlib
+
+def chunk_id(chunk):
+    """
+    Stable ID of a chunk, derived from a hash of its text and metadata.
+    Unchanged chunks keep their ID across re-runs, so indexing can skip them.
+    """
+    payload = json.dumps([chunk["text"], chunk["metadata"]], sort_keys=True, ensure_ascii=False)
+    return "chunk-" + hashlib.sha1(payload.encode("utf-8")).hexdigest()[:20]
 
 def chunk_from_riot_json(json_data):
     """
@@ -103,29 +112,98 @@ def chunk_from_riot_json(json_data):
 
     return chunks
 
-def chunk_all_patches(input_dir="../../data/patch_notes", output_path="../../data/patch_notes/chunks.json"):
+def parent_id(version, champion):
+    """ID of the parent record (summary + context) shared by the change chunks of a champion in a patch."""
+    return f"parent-{version}-{champion}"
+
+def chunk_hierarchical(json_data):
     """
-    Generate a JSON file containing all chunks extracted from patches located in a specified directory.
+    Hierarchical variant of chunk_from_riot_json.
+    Champion changes become small child chunks (one change line each, without the champion context) that link
+    to one parent record per champion holding the summary and context. Only the children are embedded and
+    searched; parents are looked up when the prompt is assembled. Item and rune chunks are unchanged.
+    :return: (children, parents)
     """
-    all_chunks = []
+    version = json_data.get("version", "unknown")
+    children = [chunk for chunk in chunk_from_riot_json(json_data) if "champion" not in chunk["metadata"]]
+    parents = []
+
+    for champ, data in json_data.get("champions", {}).items():
+        summary = data.get("summary", "")
+        context = data.get("context", "")
+        pid = parent_id(version, champ)
+
+        parents.append({
+            "id": pid,
+            "text": f"{champ} in patch {version}. Summary: {summary} Context: {context}".strip(),
+            "metadata": {"champion": champ, "patch_version": version, "type": "parent", "source": "riot", "language": "en"},
+        })
+
+        for ability in data.get("abilities", []):
+            ability_name = ability.get("ability_name", "")
+            for change in ability.get("changes", []):
+                label = change.get("label", "")
+                change_text = change.get("text", "")
+                children.append({
+                    "text": f"In patch {version}, {champ} was modified. Change in {ability_name} ({label}): {change_text}".strip(),
+                    "metadata": {
+                        "champion": champ,
+                        "patch_version": version,
+                        "ability": ability_name,
+                        "type": "patch_note",
+                        "source": "riot",
+                        "language": "en",
+                        "parent_id": pid,
+                    }
+                })
 
-    # Iterate through JSON files
-    for filename in os.listdir(input_dir):
+        # The summary stays searchable on its own ("what happened to Brand?")
+        if summary:
+            children.append({
+                "text": f"Summary of patch {version} for {champ}: {summary}",
+                "metadata": {
+                    "champion": champ,
+                    "patch_version": version,
+                    "type": "summary",
+                    "source": "riot",
+                    "language": "en",
+                    "parent_id": pid,
+                }
+            })
+
+    return children, parents
+
+def chunk_patch(json_data, hierarchical=False):
+    """Chunks a patch in the flat or hierarchical mode. Returns (chunks, parents); parents is empty when flat."""
+    if hierarchical:
+        return chunk_hierarchical(json_data)
+    return chunk_from_riot_json(json_data), []
+
+def iter_patch_dir_chunks(input_dir):
+    """Yields the chunks of every patch file of a directory, one patch in memory at a time."""
+    for filename in sorted(os.listdir(input_dir)):
         if filename.endswith(".json"):
             path = os.path.join(input_dir, filename)
             print(f"Processing file: {path}")
 
             with open(path, "r", encoding="utf-8") as f:
                 patch_data = json.load(f)
-                chunks = chunk_from_riot_json(patch_data)
-                all_chunks.extend(chunks)
+            yield from chunk_from_riot_json(patch_data)
 
-    # Save all chunks to a single file
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(all_chunks, f, indent=2, ensure_ascii=False)
+def chunk_all_patches(input_dir="../../data/patch_notes", output_path="../../data/patch_notes/chunks.jsonl"):
+    """
+    Generate a JSONL file containing all chunks extracted from patches located in a specified directory.
+    Chunks are streamed to the file patch by patch instead of being accumulated in one list.
+    """
+    from app.chunking.chunk_store import write_chunks
 
-    print(f"{len(all_chunks)} chunks saved in {output_path}")
+    count = write_chunks(output_path, iter_patch_dir_chunks(input_dir))
+
+    print(f"{count} chunks saved in {output_path}")
 
 if __name__ == "__main__":
+    import sys
+
+    # Extend sys.path to access app modules
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
     chunk_all_patches()
@@ -0,0 +1,128 @@
+# app/chunking/chunk_store.py
+import json
+import os
+
+from app.config import CHUNK_DIR
+
+# === FORMAT ===
+# chunks_<version>.jsonl: one compact JSON object ({"text": ..., "metadata": {...}}) per line,
+# so chunks can be written as they are produced and read back one at a time.
+# chunks_<version>.json (pretty-printed array) is the legacy format, still readable until converted.
+# parents_<version>.jsonl: parent records ({"id", "text", "metadata"}) of hierarchical chunks, same format.
+# chunking_<version>.json: {"mode": "flat" | "hierarchical"}, the CHUNKING_MODE the chunk file was written in.
+CHUNK_SUFFIX = ".jsonl"
+LEGACY_SUFFIX = ".json"
+
+def chunk_path(version: str, directory: str = CHUNK_DIR) -> str:
+    """Path of the chunk file of a patch (JSONL format)."""
+    return os.path.join(directory, f"chunks_{version}{CHUNK_SUFFIX}")
+
+def parent_path(version: str, directory: str = CHUNK_DIR) -> str:
+    """Path of the parent records of a patch chunked in hierarchical mode."""
+    return os.path.join(directory, f"parents_{version}{CHUNK_SUFFIX}")
+
+def mode_path(version: str, directory: str = CHUNK_DIR) -> str:
+    """Path of the record of the chunking mode a patch was chunked in."""
+    return os.path.join(directory, f"chunking_{version}.json")
+
+def find_chunk_file(version: str, directory: str = CHUNK_DIR):
+    """Existing chunk file of a patch, preferring the JSONL file over a legacy JSON array, or None."""
+    for suffix in (CHUNK_SUFFIX, LEGACY_SUFFIX):
+        path = os.path.join(directory, f"chunks_{version}{suffix}")
+        if os.path.exists(path):
+            return path
+    return None
+
+def list_chunk_versions(directory: str = CHUNK_DIR):
+    """Patch versions that have a chunk file in either format (unsorted)."""
+    versions = set()
+    for filename in os.listdir(directory):
+        if not filename.startswith("chunks_"):
+            continue
+        for suffix in (CHUNK_SUFFIX, LEGACY_SUFFIX):
+            if filename.endswith(suffix):
+                versions.add(filename[len("chunks_"):-len(suffix)])
+    return versions
+
+# === STREAMING READ / WRITE ===
+def write_chunks(path: str, chunks) -> int:
+    """
+    Writes chunks (any iterable, e.g. a generator) one line each, without building the whole file in memory.
+    The file is replaced atomically once complete. Returns the number of chunks written.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    count = 0
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(json.dumps(chunk, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+            count += 1
+    os.replace(path + ".tmp", path)
+    return count
+
+def iter_chunks(path: str):
+    """Yields the chunks of a chunk file one at a time (legacy JSON arrays are loaded whole)."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(LEGACY_SUFFIX):
+            yield from json.load(f)
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def iter_patch_chunks(version: str, directory: str = CHUNK_DIR):
+    """Yields the chunks of a patch; raises FileNotFoundError when it has no chunk file."""
+    path = find_chunk_file(version, directory)
+    if path is None:
+        raise FileNotFoundError(f"No chunk file for patch {version} in {directory}")
+    yield from iter_chunks(path)
+
+def write_parents(version: str, parents, directory: str = CHUNK_DIR) -> int:
+    """Writes the parent records of a patch; a patch without parents (flat mode) gets its stale file removed."""
+    path = parent_path(version, directory)
+    if not parents:
+        if os.path.exists(path):
+            os.remove(path)
+        return 0
+    return write_chunks(path, parents)
+
+def load_parents(version: str, directory: str = CHUNK_DIR) -> dict:
+    """Parent records of a patch by ID (empty when the patch was chunked in flat mode)."""
+    path = parent_path(version, directory)
+    if not os.path.exists(path):
+        return {}
+    return {parent["id"]: parent for parent in iter_chunks(path)}
+
+def write_chunking_mode(version: str, mode: str, directory: str = CHUNK_DIR):
+    with open(mode_path(version, directory), "w", encoding="utf-8") as f:
+        json.dump({"mode": mode}, f)
+
+def read_chunking_mode(version: str, directory: str = CHUNK_DIR):
+    """
+    Chunking mode of a patch's chunk file. Files written before the mode was recorded are flat,
+    unless they come with parent records. None when the patch has no chunk file.
+    """
+    if find_chunk_file(version, directory) is None:
+        return None
+    path = mode_path(version, directory)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("mode")
+    return "hierarchical" if os.path.exists(parent_path(version, directory)) else "flat"
+
+def save_patch_chunks(version: str, chunks, parents, mode: str, directory: str = CHUNK_DIR) -> int:
+    """Writes the chunks, parent records and chunking mode of a patch. Returns the number of chunks."""
+    count = write_chunks(chunk_path(version, directory), chunks)
+    write_parents(version, parents, directory)
+    write_chunking_mode(version, mode, directory)
+    return count
+
+# === CONVERSION ===
+def convert_chunk_file(path: str, remove: bool = False) -> str:
+    """Rewrites a legacy chunks_<version>.json array as chunks_<version>.jsonl and returns the new path."""
+    target = path[:-len(LEGACY_SUFFIX)] + CHUNK_SUFFIX
+    count = write_chunks(target, iter_chunks(path))
+    if remove:
+        os.remove(path)
+    print(f"{path} -> {target} ({count} chunks)")
+    return target
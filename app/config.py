@@ -1,5 +1,6 @@
 # app/config.py
 
+import importlib.util
 import os
 
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -10,11 +11,89 @@ PATCH_DIR = os.path.join(ROOT_DIR, "data", "patch_notes")
 
 EMBED_MODEL = "intfloat/multilingual-e5-base"
 RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-12-v2"
+RERANK_MODEL_FAST = "cross-encoder/ms-marco-MiniLM-L-6-v2"
 LLM_MODEL = "mistral"
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://ollama:11434")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "300"))  # seconds to wait for a (non-streamed) answer
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_WARMUP_TIMEOUT = float(os.getenv("OLLAMA_WARMUP_TIMEOUT", "60"))  # seconds to wait for the model preload
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "8"))  # pooled keep-alive connections to Ollama
+# How long Ollama keeps the model loaded after a request (Ollama duration, e.g. "30m"; "-1" = forever)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "4096"))  # context window; prompts are capped by PROMPT_TOKEN_BUDGET
 
 def get_chroma_host():
     env = os.getenv("ENV", "local")
     if env == "local":
         return "localhost", 8001
     else:
-        return "chroma", 8000
\ No newline at end of file
+        return "chroma", 8000
+
+# === INGESTION ===
+SCRAPE_WORKERS = int(os.getenv("SCRAPE_WORKERS", "8"))  # concurrent page downloads
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))  # processes parsing HTML
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+# Bodies + ETag/Last-Modified of scraped pages, for conditional GETs
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", os.path.join(ROOT_DIR, "data", "http_cache"))
+# BeautifulSoup parser: lxml is much faster than the pure-Python html.parser when installed
+HTML_PARSER = os.getenv("HTML_PARSER", "lxml" if importlib.util.find_spec("lxml") else "html.parser")
+
+# === INFERENCE ===
+# Threads used by the async pipeline to run the embedder and reranker off the event loop
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+
+# Runtime of the embedder and reranker: "torch" (fp32), "int8" (dynamically quantized Linear layers)
+# or "onnx" (ONNX Runtime, models exported to ONNX_MODEL_DIR on first load; needs onnxruntime)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(ROOT_DIR, "data", "onnx"))
+
+# Coalesce concurrent query embeddings / reranker calls into shared batches
+MICRO_BATCHING = os.getenv("MICRO_BATCHING", "false").lower() == "true"
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "5"))
+MICRO_BATCH_MAX_SIZE = int(os.getenv("MICRO_BATCH_MAX_SIZE", "32"))
+
+# === RETRIEVAL ===
+# Fuse BM25 results over the patch chunks with the dense Chroma results (reciprocal rank fusion)
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+# Restrict the search to the champions / items / runes named in the question (unfiltered search as fallback)
+ENTITY_FILTER = os.getenv("ENTITY_FILTER", "true").lower() == "true"
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+# Threads used to query several patch collections concurrently (history questions)
+MULTI_PATCH_WORKERS = int(os.getenv("MULTI_PATCH_WORKERS", "4"))
+
+# "chroma" queries the Chroma server, "local" answers from the in-process NumPy index written by build_chroma
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma")
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(ROOT_DIR, "data", "vector_index"))
+
+# === RERANKING ===
+RERANK_TIER = os.getenv("RERANK_TIER", "accurate")  # "accurate" (MiniLM-L-12) or "fast" (MiniLM-L-6)
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))  # tokens per (query, chunk) pair
+# Skip the cross-encoder when the best dense match beats the runner-up by this cosine margin (<= 0 never skips)
+RERANK_SKIP_MARGIN = float(os.getenv("RERANK_SKIP_MARGIN", "0.08"))
+
+# === PROMPTING ===
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))  # whole prompt, estimated tokens
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "400"))  # share of it kept for past turns
+HISTORY_TURN_MAX_TOKENS = 150  # longer past messages are truncated
+HISTORY_MAX_TURNS = 6
+FOLLOWUP_MAX_WORDS = 6  # shorter questions are searched together with the previous user question
+
+# === INDEXING ===
+# "flat": every change chunk repeats the champion context. "hierarchical": change chunks link to one parent
+# record (summary + context) per champion, added to the prompt once (see chunk_hierarchical)
+CHUNKING_MODE = os.getenv("CHUNKING_MODE", "flat")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+CHROMA_WRITE_BATCH_SIZE = int(os.getenv("CHROMA_WRITE_BATCH_SIZE", "256"))
+# Content-addressed cache of passage embeddings reused across (re-)indexing runs ("" disables it)
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", os.path.join(ROOT_DIR, "data", "embed_cache"))
+
+# === CACHING ===
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # seconds, 0 disables the answer cache
+# Answers reused for reworded questions (cosine similarity of the e5 query vectors); same TTL as the answer cache
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1024"))  # 0 disables the semantic cache
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
@@ -1,61 +1,115 @@
 # app/embedding/build_chroma.py
 
-import json
-import os
-import chromadb
-from transformers import AutoTokenizer, AutoModel
-import torch
-from tqdm import tqdm
-import numpy as np
-from app.config import CHROMA_DIR, EMBED_MODEL, get_chroma_host
-
-def normalize(vec):
-    return vec / np.linalg.norm(vec)
+import argparse
+import time
+from app.backend.chroma import get_chroma_client, invalidate_collection_cache
+from app.backend.models import embed_texts
+from app.backend.vector_index import has_vector_index, write_vector_index
+from app.chunking.chunk_patch_notes import chunk_id
+from app.chunking.chunk_store import iter_patch_chunks, list_chunk_versions
+from app.config import CHROMA_DIR, EMBED_BATCH_SIZE, EMBED_CACHE_DIR, EMBED_MODEL, CHROMA_WRITE_BATCH_SIZE, INFERENCE_BACKEND
+from app.embedding.embedding_store import EmbeddingStore, embed_texts_cached
 
 # Parameters
 COLLECTION_NAME = "patch_chunks"
 
-def build_chroma(chunks, collection_name):
-    host, port = get_chroma_host()
-    client = chromadb.HttpClient(host=host, port=port)
-
-    try:
-        client.delete_collection(name=collection_name)
-    except:
-        pass
-
-    collection = client.create_collection(name=collection_name)
-
-    # Embedding model
-    # Load e5-base model
-    tokenizer = AutoTokenizer.from_pretrained(EMBED_MODEL)
-    model = AutoModel.from_pretrained(EMBED_MODEL)
-
-    def embed_text(text: str):
-        # Required prefix for documents
-        text = "passage: " + text.strip()
-        inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True)
-        with torch.no_grad():
-            output = model(**inputs)
-            embeddings = output.last_hidden_state[:, 0, :]
-            return normalize(embeddings.squeeze().numpy())
-
-    print(f"Embedding {len(chunks)} chunks...")
-
-    # Batch insertion into Chroma
-    for i, chunk in enumerate(tqdm(chunks)):
-        doc_id = f"chunk-{i}"
-        embedding = embed_text(chunk["text"])
-
-        # Add chunk with metadata
-        collection.add(
-            documents=[chunk["text"]],
-            embeddings=[embedding],
-            metadatas=[chunk["metadata"]],
-            ids=[doc_id]
+_embedding_store = None
+
+def get_embedding_store():
+    """
+    Returns the on-disk passage embedding cache, or None when EMBED_CACHE_DIR is empty.
+    Keyed by model and inference backend: int8/onnx vectors differ slightly from fp32 ones and must not be mixed.
+    """
+    global _embedding_store
+    if _embedding_store is None and EMBED_CACHE_DIR:
+        _embedding_store = EmbeddingStore(EMBED_CACHE_DIR, f"{EMBED_MODEL}@{INFERENCE_BACKEND}")
+    return _embedding_store
+
+def build_chroma(chunks, collection_name, batch_size=EMBED_BATCH_SIZE, write_batch_size=CHROMA_WRITE_BATCH_SIZE, rebuild=False):
+    """
+    Syncs a Chroma collection with the given chunks (any iterable, read once).
+    Chunk IDs are content hashes (see chunk_id): only new or changed chunks are embedded and upserted,
+    and chunks that disappeared are deleted. With rebuild=True the collection is dropped first.
+    """
+    client = get_chroma_client()
+
+    if rebuild:
+        try:
+            client.delete_collection(name=collection_name)
+        except:
+            pass
+
+    collection = client.get_or_create_collection(name=collection_name)
+
+    # Deduplicate: identical chunks share the same ID
+    wanted = {}
+    for chunk in chunks:
+        wanted.setdefault(chunk_id(chunk), chunk)
+
+    existing = set(collection.get(include=[])["ids"])
+    new_ids = [doc_id for doc_id in wanted if doc_id not in existing]
+    stale_ids = [doc_id for doc_id in existing if doc_id not in wanted]
+
+    for i in range(0, len(stale_ids), write_batch_size):
+        collection.delete(ids=stale_ids[i:i + write_batch_size])
+
+    print(f"{collection_name}: {len(new_ids)} new, {len(stale_ids)} removed, {len(existing) - len(stale_ids)} unchanged")
+    if new_ids:
+        new_chunks = [wanted[doc_id] for doc_id in new_ids]
+        _embed_and_upsert(collection, new_chunks, new_ids, batch_size, write_batch_size)
+
+    if rebuild or new_ids or stale_ids:
+        invalidate_collection_cache(collection_name)
+    if rebuild or new_ids or stale_ids or not has_vector_index(collection_name):
+        export_vector_index(collection)
+
+def export_vector_index(collection):
+    """Snapshots the collection to the NumPy index used by RETRIEVAL_BACKEND = "local"."""
+    data = collection.get(include=["embeddings", "documents", "metadatas"])
+    write_vector_index(collection.name, data["ids"], data["embeddings"], data["documents"], data["metadatas"])
+    print(f"Local vector index written for {collection.name} ({len(data['ids'])} vectors)")
+
+def _embed_and_upsert(collection, chunks, ids, batch_size, write_batch_size):
+    """Embeds chunks in batches and writes them to the collection with bulk upserts. Returns chunks/sec."""
+    print(f"Embedding {len(chunks)} chunks (batch size {batch_size})...")
+    start = time.perf_counter()
+
+    texts = [chunk["text"] for chunk in chunks]
+    store = get_embedding_store()
+    if store is not None:
+        embed_fn = lambda missing: embed_texts(missing, prefix="passage: ", batch_size=batch_size)
+        embeddings = embed_texts_cached(texts, embed_fn, store, prefix="passage: ")
+    else:
+        embeddings = embed_texts(texts, prefix="passage: ", batch_size=batch_size)
+    embed_time = time.perf_counter() - start
+
+    # Bulk insertion into Chroma
+    for i in range(0, len(chunks), write_batch_size):
+        batch = chunks[i:i + write_batch_size]
+        collection.upsert(
+            documents=[chunk["text"] for chunk in batch],
+            embeddings=embeddings[i:i + write_batch_size].tolist(),
+            metadatas=[chunk["metadata"] for chunk in batch],
+            ids=ids[i:i + write_batch_size]
         )
 
-    print(f"{len(chunks)} chunks indexed in Chroma ({collection_name})")
+    elapsed = time.perf_counter() - start
+    rate = len(chunks) / elapsed if elapsed > 0 else 0.0
+    print(
+        f"{len(chunks)} chunks indexed in Chroma ({collection.name}) in {elapsed:.2f}s "
+        f"(embedding {embed_time:.2f}s, {rate:.1f} chunks/sec)"
+    )
+    return rate
 
 if __name__ == "__main__":
-    build_chroma()
+    parser = argparse.ArgumentParser(description="Index the bundled chunk files into Chroma.")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE)
+    parser.add_argument("--write-batch-size", type=int, default=CHROMA_WRITE_BATCH_SIZE)
+    parser.add_argument("--rebuild", action="store_true", help="drop and re-embed every collection")
+    args = parser.parse_args()
+
+    for version in sorted(list_chunk_versions()):
+        build_chroma(
+            iter_patch_chunks(version), f"patch_{version}",
+            batch_size=args.batch_size, write_batch_size=args.write_batch_size, rebuild=args.rebuild
+        )
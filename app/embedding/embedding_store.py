@@ -0,0 +1,154 @@
+# app/embedding/embedding_store.py
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from app.config import EMBED_CACHE_DIR, EMBED_MODEL
+
+KEY_SIZE = 16  # bytes of blake2b digest per entry in the index file
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, one writer at a time is assumed
+    fcntl = None
+
+class EmbeddingStore:
+    """
+    Content-addressed, on-disk embedding cache keyed by (model name, prefix, text hash).
+
+    Layout of <directory>/<model slug>/:
+      - meta.json    model name and vector dimension
+      - vectors.f32  float32 vectors, one row per entry, read through np.memmap
+      - index.bin    one KEY_SIZE-byte digest per row, in the same order
+    Entries are append-only. A different model (or dimension) wipes the store.
+    Appends hold an exclusive lock on <model slug>.lock, so concurrent build_chroma processes cannot interleave rows.
+    """
+
+    def __init__(self, directory: str = EMBED_CACHE_DIR, model_name: str = EMBED_MODEL):
+        self.model_name = model_name
+        self.directory = os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        self.meta_path = os.path.join(self.directory, "meta.json")
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.index_path = os.path.join(self.directory, "index.bin")
+        self.lock_path = self.directory + ".lock"
+        self.dim = None
+        self._rows = {}
+        self._mmap = None
+        self._lock = threading.Lock()
+        self._load()
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock shared by every process using this store."""
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        with open(self.lock_path, "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load(self):
+        with self._file_lock():
+            self._sync()
+
+    def _sync(self):
+        """Reads the rows stored so far (by any process); must run under the file lock."""
+        self._rows = {}
+        self._mmap = None
+        self.dim = None
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("model") != self.model_name:
+            print(f"Embedding cache built with {meta.get('model')}, resetting for {self.model_name}")
+            shutil.rmtree(self.directory, ignore_errors=True)
+            return
+
+        self.dim = meta["dim"]
+        for path in (self.vectors_path, self.index_path):
+            open(path, "ab").close()
+        with open(self.index_path, "rb") as f:
+            index = f.read()
+        # A write interrupted between the two appends leaves extra vectors (or digests): cut both files back
+        # to the complete rows, so the next append starts right after them and row numbers stay aligned
+        n_rows = min(len(index) // KEY_SIZE, os.path.getsize(self.vectors_path) // (4 * self.dim))
+        for path, size in ((self.vectors_path, n_rows * 4 * self.dim), (self.index_path, n_rows * KEY_SIZE)):
+            if os.path.getsize(path) != size:
+                os.truncate(path, size)
+        self._rows = {index[i * KEY_SIZE:(i + 1) * KEY_SIZE]: i for i in range(n_rows)}
+
+    def key(self, text: str, prefix: str = "") -> bytes:
+        """Digest identifying (model, prefix, text)."""
+        payload = f"{self.model_name}\0{prefix}\0{text}".encode("utf-8")
+        return hashlib.blake2b(payload, digest_size=KEY_SIZE).digest()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _vectors(self):
+        n = len(self._rows)
+        if self._mmap is None or self._mmap.shape[0] != n:
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim)) if n else None
+        return self._mmap
+
+    def get_many(self, keys):
+        """Returns {position in keys: vector} for the keys already in the store."""
+        with self._lock:
+            found = {i: self._rows[k] for i, k in enumerate(keys) if k in self._rows}
+            if not found:
+                return {}
+            vectors = self._vectors()
+            return {i: np.array(vectors[row]) for i, row in found.items()}
+
+    def add_many(self, keys, vectors):
+        """Appends new (key, vector) entries; keys already stored are ignored."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock():
+            self._sync()  # another process may have appended since the last read
+            if self.dim is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self.dim = int(vectors.shape[1])
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model_name, "dim": self.dim}, f)
+                for path in (self.vectors_path, self.index_path):
+                    open(path, "wb").close()
+
+            new = [(k, vec) for k, vec in zip(keys, vectors) if k not in self._rows]
+            if not new:
+                return
+            # Vectors first: a row only counts once its digest is in the index
+            start = len(self._rows)
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.stack([vec for _, vec in new]).astype(np.float32).tobytes())
+            with open(self.index_path, "ab") as f:
+                f.write(b"".join(k for k, _ in new))
+            for row, (k, _) in enumerate(new, start):
+                self._rows[k] = row
+
+def embed_texts_cached(texts, embed_fn, store: EmbeddingStore, prefix: str = "passage: "):
+    """
+    Embeds texts through the store: cached vectors are reused and only the missing texts
+    are passed to embed_fn(texts) -> (n, dim) matrix. Returns a (len(texts), dim) float32 matrix.
+    """
+    keys = [store.key(text.strip(), prefix) for text in texts]
+    cached = store.get_many(keys)
+    missing = [i for i in range(len(texts)) if i not in cached]
+    print(f"Embedding cache: {len(cached)} reused, {len(missing)} to embed")
+
+    computed = {}
+    if missing:
+        vectors = embed_fn([texts[i] for i in missing])
+        store.add_many([keys[i] for i in missing], vectors)
+        computed = dict(zip(missing, vectors))
+
+    return np.asarray([cached[i] if i in cached else computed[i] for i in range(len(texts))], dtype=np.float32)
@@ -2,38 +2,86 @@
 
 import os
 import json
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
+from app.ingestion.http_cache import annotate, fetch_conditional, load_entry
 from app.ingestion.patch_scraper import get_patch_links
-from app.ingestion.parse_patch import parse_patch
-from app.chunking.chunk_patch_notes import chunk_from_riot_json
-from app.config import PATCH_DIR, CHUNK_DIR
+from app.ingestion.parse_patch import parse_patch_html
+from app.chunking.chunk_patch_notes import chunk_patch
+from app.chunking.chunk_store import read_chunking_mode, save_patch_chunks
+from app.config import PATCH_DIR, CHUNK_DIR, CHUNKING_MODE, PARSE_WORKERS, SCRAPE_WORKERS
+
+def fetch_pages(urls, workers=SCRAPE_WORKERS):
+    """
+    Downloads pages concurrently with conditional GETs, keeping the order of urls.
+    :return: list of (html, changed) tuples
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(urls) or 1))) as pool:
+        return list(pool.map(fetch_conditional, urls))
+
+def _already_processed(url):
+    """
+    Version of an unchanged page whose chunks were already written by a previous run in the current
+    CHUNKING_MODE, else None (switching the mode re-chunks every patch).
+    """
+    version = (load_entry(url) or {}).get("version")
+    if version and read_chunking_mode(version) == CHUNKING_MODE:
+        return version
+    return None
+
+def parse_pages(pages, workers=PARSE_WORKERS):
+    """Parses patch pages, in a process pool when there is more than one page."""
+    if workers <= 1 or len(pages) <= 1:
+        return [parse_patch_html(html) for html in pages]
+    with ProcessPoolExecutor(max_workers=min(workers, len(pages))) as pool:
+        return list(pool.map(parse_patch_html, pages))
 
 def run_ingestion_pipeline(limit=3):
+    """
+    Downloads, parses and chunks the latest patches.
+    Pages answered with 304 (or an identical body) whose chunks already exist are skipped.
+    :return: the versions that were (re-)chunked in this run
+    """
     os.makedirs(PATCH_DIR, exist_ok=True)
     os.makedirs(CHUNK_DIR, exist_ok=True)
 
+    start = time.perf_counter()
     patch_links = get_patch_links(limit=limit)
+    pages = fetch_pages(patch_links)
 
-    for url in patch_links:
-        patch = parse_patch(url)
+    to_parse = []
+    for url, (html, changed) in zip(patch_links, pages):
+        version = None if changed else _already_processed(url)
+        if version:
+            print(f"Patch {version} unchanged, skipping")
+        else:
+            to_parse.append((url, html))
+
+    patches = parse_pages([html for _, html in to_parse])
+    print(f"{len(pages)} patches fetched, {len(patches)} parsed in {time.perf_counter() - start:.2f}s")
+
+    updated_versions = []
+    for (url, _), patch in zip(to_parse, patches):
         version = patch.get("version", "unknown")
         patch_file = os.path.join(PATCH_DIR, f"patch_{version}.json")
 
-        # Save raw patch if it doesn't exist
-        if not os.path.exists(patch_file):
-            with open(patch_file, "w", encoding="utf-8") as f:
-                json.dump(patch, f, indent=2, ensure_ascii=False)
-            print(f"Patch {version} saved")
+        # Save raw patch (new, or updated since the last run)
+        with open(patch_file, "w", encoding="utf-8") as f:
+            json.dump(patch, f, indent=2, ensure_ascii=False)
+        print(f"Patch {version} saved")
+
+        # Chunking the patch, streamed to its JSONL chunk file (+ parent records in hierarchical mode)
+        chunks, parents = chunk_patch(patch, hierarchical=CHUNKING_MODE == "hierarchical")
+        count = save_patch_chunks(version, chunks, parents, CHUNKING_MODE)
 
-        # Chunking the patch
-        chunks = chunk_from_riot_json(patch)
+        print(f"{count} chunks created for patch {version}")
 
-        # Save individual chunks
-        chunk_file = os.path.join(CHUNK_DIR, f"chunks_{version}.json")
-        with open(chunk_file, "w", encoding="utf-8") as f:
-            json.dump(chunks, f, indent=2, ensure_ascii=False)
+        # Remember which version this page produced, so an unchanged page can be skipped next time
+        annotate(url, version=version)
+        updated_versions.append(version)
 
-        print(f"{len(chunks)} chunks created for patch {version}")
+    return updated_versions
 
 if __name__ == "__main__":
     run_ingestion_pipeline()
@@ -0,0 +1,36 @@
+# app/ingestion/http.py
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.config import HTTP_RETRIES, HTTP_TIMEOUT, SCRAPE_WORKERS
+
+_session = None
+
+def get_session():
+    """
+    Returns the shared requests session used by ingestion:
+    pooled keep-alive connections (one per scrape worker) and retries with backoff on transient errors.
+    """
+    global _session
+    if _session is None:
+        retry = Retry(
+            total=HTTP_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET", "HEAD"],
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(SCRAPE_WORKERS, 1), max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({"User-Agent": "LeagueGPT-ingestion"})
+        _session = session
+    return _session
+
+def fetch(url, session=None):
+    """Downloads a page through the pooled session and returns its text."""
+    res = (session or get_session()).get(url, timeout=HTTP_TIMEOUT)
+    res.raise_for_status()
+    return res.text
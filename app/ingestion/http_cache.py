@@ -0,0 +1,65 @@
+# app/ingestion/http_cache.py
+
+import hashlib
+import json
+import os
+
+from app.config import HTTP_CACHE_DIR, HTTP_TIMEOUT
+from app.ingestion.http import get_session
+
+def _entry_path(url):
+    return os.path.join(HTTP_CACHE_DIR, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+def load_entry(url):
+    """Returns the cached entry of a URL (body, etag, last_modified, body_hash, ...) or None."""
+    path = _entry_path(url)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_entry(url, entry):
+    os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+    tmp_path = _entry_path(url) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, _entry_path(url))
+
+def fetch_conditional(url, session=None):
+    """
+    Downloads a page with a conditional GET (If-None-Match / If-Modified-Since from the cached entry).
+    :return: (text, changed) where changed is False on a 304 or when the body hash did not change
+    """
+    entry = load_entry(url)
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    res = (session or get_session()).get(url, headers=headers, timeout=HTTP_TIMEOUT)
+    if res.status_code == 304 and entry:
+        return entry["body"], False
+    res.raise_for_status()
+
+    body = res.text
+    body_hash = hashlib.sha256(body.encode("utf-8")).hexdigest()
+    changed = not entry or entry.get("body_hash") != body_hash
+
+    new_entry = dict(entry or {}) if not changed else {"url": url}
+    new_entry.update({
+        "etag": res.headers.get("ETag"),
+        "last_modified": res.headers.get("Last-Modified"),
+        "body_hash": body_hash,
+        "body": body,
+    })
+    save_entry(url, new_entry)
+    return body, changed
+
+def annotate(url, **fields):
+    """Stores extra fields on a cached entry (e.g. the patch version parsed from it)."""
+    entry = load_entry(url)
+    if entry is not None:
+        entry.update(fields)
+        save_entry(url, entry)
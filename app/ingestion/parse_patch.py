@@ -1,11 +1,13 @@
 # app/ingestion/parse_patch.py
 
-import requests
 import re
 import json
 
 from bs4 import BeautifulSoup
 
+from app.config import HTML_PARSER
+from app.ingestion.http import fetch
+
 def parse_patch(url):
     """
     Fetches and structures changes from a League of Legends patch,
@@ -13,8 +15,17 @@ def parse_patch(url):
     :param url: URL of the patch page (e.g., https://.../patch-14-6-notes/)
     :return: structured dictionary of changes
     """
-    res = requests.get(url)
-    soup = BeautifulSoup(res.text, 'html.parser')
+    return parse_patch_html(fetch(url))
+
+def parse_patch_html(html, parser=HTML_PARSER):
+    """
+    Structures the changes of an already downloaded patch page (see parse_patch).
+    Pure function of the HTML, so it can run in a process pool.
+    :param html: HTML of the patch page
+    :param parser: BeautifulSoup parser ('lxml' or 'html.parser')
+    :return: structured dictionary of changes
+    """
+    soup = BeautifulSoup(html, parser)
 
     # Extract patch title (e.g., Patch 14.6)
     title_tag = soup.find("h1")
@@ -1,8 +1,10 @@
 # app/ingestion/patch_scraper.py
 
-import requests
 from bs4 import BeautifulSoup
 
+from app.config import HTML_PARSER
+from app.ingestion.http_cache import fetch_conditional
+
 # Base URL of the League of Legends website
 BASE_URL = "https://www.leagueoflegends.com"
 
@@ -17,8 +19,8 @@ def get_patch_links(limit=3):
     :return: A list containing URLs of the latest patches.
     """
     # Request the news page content
-    res = requests.get(NEWS_URL)
-    soup = BeautifulSoup(res.text, 'html.parser')
+    html, _ = fetch_conditional(NEWS_URL)
+    soup = BeautifulSoup(html, HTML_PARSER)
 
     patch_links = []
     articles = soup.find_all("a", href=True)
@@ -0,0 +1,93 @@
+# scripts/bench_inference_backends.py
+"""
+Checks an inference backend (int8 / onnx) against the fp32 PyTorch models on the bundled chunks, then times both.
+
+Parity: every chunk of the patch is embedded with each backend, one question per champion/ability is searched,
+and the top-k chunk sets are compared (overlap@k). The reranker is compared on the fp32 candidates
+(top-1 agreement and largest sigmoid score difference).
+
+Usage: python scripts/bench_inference_backends.py [--backend int8] [--version 25.07] [-k 5] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+# Extend sys.path to access app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+from app.backend.chroma import get_latest_patch_version
+from app.backend.lexical import load_chunks
+from app.backend.models import INFERENCE_BACKENDS, embed_texts, rerank_logits
+
+def make_questions(chunks):
+    """One question per (champion, ability) of the patch, the way users phrase them."""
+    questions = []
+    seen = set()
+    for chunk in chunks:
+        meta = chunk["metadata"]
+        key = (meta.get("champion"), meta.get("ability"))
+        if key[0] and key not in seen:
+            seen.add(key)
+            questions.append(f"Qu'est-ce qui a changé sur {key[1]} de {key[0]} ?" if key[1] else f"Quels changements pour {key[0]} ?")
+    return questions
+
+def top_k(queries, passages, k):
+    """Indices of the k most similar passages per query (vectors are normalized)."""
+    return np.argsort(-(queries @ passages.T), axis=1)[:, :k]
+
+def rerank_scores(question, texts, backend):
+    import torch
+    return torch.sigmoid(rerank_logits([(question, text) for text in texts], backend=backend).reshape(-1)).numpy()
+
+def time_ms(fn, repeat):
+    fn()  # warm-up
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, [50, 95])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="int8", choices=[b for b in INFERENCE_BACKENDS if b != "torch"])
+    parser.add_argument("--version", default=None)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    version = args.version or get_latest_patch_version()
+    chunks = load_chunks(version)
+    texts = [chunk["text"] for chunk in chunks]
+    questions = make_questions(chunks)
+    print(f"Patch {version}: {len(texts)} chunks, {len(questions)} questions, backend torch vs {args.backend}\n")
+
+    # === PARITY ===
+    passages = {b: embed_texts(texts, backend=b) for b in ("torch", args.backend)}
+    queries = {b: embed_texts(questions, prefix="query: ", backend=b) for b in ("torch", args.backend)}
+    reference = top_k(queries["torch"], passages["torch"], args.k)
+    candidate = top_k(queries[args.backend], passages[args.backend], args.k)
+    overlap = np.mean([len(set(r) & set(c)) / args.k for r, c in zip(reference, candidate)])
+    cosine = np.mean(np.sum(passages["torch"] * passages[args.backend], axis=1))
+
+    top1_agree = 0
+    max_diff = 0.0
+    for question, rows in zip(questions, reference):
+        fp32 = rerank_scores(question, [texts[i] for i in rows], "torch")
+        other = rerank_scores(question, [texts[i] for i in rows], args.backend)
+        top1_agree += int(np.argmax(fp32) == np.argmax(other))
+        max_diff = max(max_diff, float(np.max(np.abs(fp32 - other))))
+
+    print(f"Embedder  overlap@{args.k} {overlap:.3f}   mean passage cosine {cosine:.4f}")
+    print(f"Reranker  top-1 agreement {top1_agree / len(questions):.3f}   max score diff {max_diff:.4f}\n")
+
+    # === LATENCY ===
+    question = questions[0]
+    candidates = [texts[i] for i in reference[0]]
+    for backend in ("torch", args.backend):
+        embed_p50, embed_p95 = time_ms(lambda: embed_texts([question], prefix="query: ", backend=backend), args.repeat)
+        rerank_p50, rerank_p95 = time_ms(lambda: rerank_logits([(question, c) for c in candidates], backend=backend), args.repeat)
+        print(f"{backend:<6} embed p50 {embed_p50:7.2f} ms  p95 {embed_p95:7.2f} ms   "
+              f"rerank({len(candidates)}) p50 {rerank_p50:7.2f} ms  p95 {rerank_p95:7.2f} ms")
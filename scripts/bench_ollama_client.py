@@ -0,0 +1,117 @@
+# scripts/bench_ollama_client.py
+"""
+Warm vs cold generation latency against a stub Ollama server (no model needed).
+
+The stub mimics what costs time in Ollama besides decoding:
+- loading the model when it is not resident (unloaded once the request's keep_alive has expired),
+- evaluating the part of the prompt that does not share a prefix with the previous prompt.
+
+cold: a new connection per request (plain requests.post) and keep_alive "0", i.e. the model is reloaded every time,
+      which is what users hit after an idle period.
+warm: app.backend.ollama (pooled session, OLLAMA_KEEP_ALIVE, OLLAMA_NUM_CTX).
+Prompts are built with build_prompt from the bundled chunks, one per champion.
+
+Usage: python scripts/bench_ollama_client.py [--version 25.07] [--load-ms 400] [--eval-us-per-char 20]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Extend sys.path to access app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# === STUB OLLAMA ===
+def parse_duration(value):
+    """Seconds of an Ollama keep_alive value ("30m", "10s", 300, "-1" = forever)."""
+    if value is None:
+        return 300.0  # Ollama's default of 5 minutes
+    match = re.fullmatch(r"(-?\d+(?:\.\d+)?)([smh]?)", str(value).strip())
+    if not match:
+        return 300.0
+    seconds = float(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[match.group(2)]
+    return float("inf") if seconds < 0 else seconds
+
+class StubOllama(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive connections
+    load_seconds = 0.4
+    eval_seconds_per_char = 20e-6
+    state = {"loaded_until": 0.0, "previous_prompt": "", "loads": 0}
+    lock = threading.Lock()
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = payload.get("prompt", "")
+        with self.lock:
+            now = time.monotonic()
+            if now >= self.state["loaded_until"]:
+                time.sleep(self.load_seconds)
+                self.state["loads"] += 1
+                self.state["previous_prompt"] = ""  # the KV cache went away with the model
+            previous = self.state["previous_prompt"]
+            shared = len(os.path.commonprefix([previous, prompt]))
+            time.sleep((len(prompt) - shared) * self.eval_seconds_per_char)
+            self.state["previous_prompt"] = prompt
+            self.state["loaded_until"] = time.monotonic() + parse_duration(payload.get("keep_alive"))
+
+        body = json.dumps({"response": "ok", "done": True}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+# === BENCHMARK ===
+def bench(name, send, prompts):
+    import numpy as np
+    loads_before = StubOllama.state["loads"]
+    latencies = []
+    for prompt in prompts:
+        start = time.perf_counter()
+        send(prompt)
+        latencies.append((time.perf_counter() - start) * 1000)
+    p50, p95 = np.percentile(latencies, [50, 95])
+    print(f"{name:<5} p50 {p50:8.2f} ms   p95 {p95:8.2f} ms   mean {np.mean(latencies):8.2f} ms   "
+          f"model loads {StubOllama.state['loads'] - loads_before}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--version", default=None)
+    parser.add_argument("--load-ms", type=float, default=400.0, help="simulated model load time")
+    parser.add_argument("--eval-us-per-char", type=float, default=20.0, help="simulated prompt evaluation cost")
+    args = parser.parse_args()
+
+    StubOllama.load_seconds = args.load_ms / 1000
+    StubOllama.eval_seconds_per_char = args.eval_us_per_char / 1e6
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllama)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OLLAMA_URL"] = url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    import requests
+    from app.backend.chroma import get_latest_patch_version
+    from app.backend.lexical import load_chunks
+    from app.backend.ollama import ask_ollama
+    from app.backend.prompting import SYSTEM_PROMPT, build_prompt
+    from app.config import LLM_MODEL
+
+    chunks = load_chunks(args.version or get_latest_patch_version())
+    by_champion = {}
+    for chunk in chunks:
+        by_champion.setdefault(chunk["metadata"].get("champion"), []).append(chunk["text"])
+    prompts = [build_prompt(texts, f"Quels changements pour {champion} ?") for champion, texts in by_champion.items() if champion]
+    print(f"{len(prompts)} prompts, stable prefix of {len(SYSTEM_PROMPT)} chars, "
+          f"load {args.load_ms:.0f} ms, eval {args.eval_us_per_char:.0f} us/char\n")
+
+    def cold(prompt):
+        requests.post(f"{url}/api/generate", json={"model": LLM_MODEL, "prompt": prompt, "stream": False, "keep_alive": "0"})
+
+    bench("cold", cold, prompts)
+    bench("warm", ask_ollama, prompts)
+    server.shutdown()
@@ -0,0 +1,310 @@
+# scripts/bench_pipeline.py
+"""
+Offline benchmark of the RAG pipeline on the bundled patches (25.06 / 25.07).
+
+The Chroma server and Ollama are replaced by in-process fakes (a NumPy collection and a local HTTP server
+answering /api/generate), so only our code and the models are measured and runs are reproducible.
+Stages: chunk (chunk_patch on patch_<version>.json), ingestion (embed + index the bundled chunk file),
+search_chunks, rerank_chunks, build_prompt and generate_answer.
+For each stage: p50 / p95 / mean latency, throughput and peak RSS, written to a JSON file for comparing commits.
+
+The indexed chunks are the bundled chunk files (iter_patch_chunks), the same ones the BM25 index and the entity
+matcher read, so hybrid retrieval and entity filters behave as in production.
+Query and answer caches are bypassed unless --warm-caches is given, so every question pays the full path.
+
+Usage: python scripts/bench_pipeline.py [--versions 25.06 25.07] [--repeat 3] [--ollama-delay-ms 0]
+                                        [--output data/benchmarks/run.json] [--baseline previous.json]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# === FAKE OLLAMA ===
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Answers /api/generate like Ollama (JSON or NDJSON stream) after a fixed delay."""
+    delay = 0.0
+    answer = "Brand inflige plus de dégâts aux monstres de la jungle."
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.delay)
+        if payload.get("stream"):
+            lines = [{"response": word + " ", "done": False} for word in self.answer.split()] + [{"done": True}]
+            body = "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+            content_type = "application/x-ndjson"
+        else:
+            body = json.dumps({"response": self.answer, "done": True}).encode("utf-8")
+            content_type = "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_fake_ollama(delay_ms):
+    FakeOllamaHandler.delay = delay_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOllamaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# === FAKE CHROMA ===
+class FakeCollection:
+    """In-process collection with the subset of the Chroma API used by build_chroma and the retrieval code."""
+
+    def __init__(self, name):
+        import numpy as np
+        self.name = name
+        self.records = {}  # id -> (embedding, document, metadata)
+        self._np = np
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        for doc_id, embedding, document, metadata in zip(ids, embeddings, documents, metadatas):
+            self.records[doc_id] = (self._np.asarray(embedding, dtype=self._np.float32), document, metadata)
+
+    add = upsert
+
+    def delete(self, ids):
+        for doc_id in ids:
+            self.records.pop(doc_id, None)
+
+    def count(self):
+        return len(self.records)
+
+    def get(self, ids=None, include=None, limit=None):
+        selected = list(ids if ids is not None else self.records)[:limit]
+        include = include if include is not None else ["documents", "metadatas"]
+        result = {"ids": selected}
+        if "embeddings" in include:
+            result["embeddings"] = [self.records[i][0] for i in selected]
+        if "documents" in include:
+            result["documents"] = [self.records[i][1] for i in selected]
+        if "metadatas" in include:
+            result["metadatas"] = [self.records[i][2] for i in selected]
+        return result
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        from app.backend.vector_index import _matches
+        np = self._np
+        ids = [i for i, record in self.records.items() if not where or _matches(record[2], where)]
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        matrix = np.stack([self.records[i][0] for i in ids]) if ids else np.empty((0, 0), dtype=np.float32)
+        for query in query_embeddings:
+            distances = 2.0 - 2.0 * (matrix @ np.asarray(query, dtype=np.float32)) if ids else np.empty(0)
+            top = np.argsort(distances)[:n_results]
+            result["ids"].append([ids[i] for i in top])
+            result["documents"].append([self.records[ids[i]][1] for i in top])
+            result["metadatas"].append([self.records[ids[i]][2] for i in top])
+            result["distances"].append(distances[top].tolist())
+        return result
+
+class FakeChromaClient:
+    def __init__(self):
+        self.collections = {}
+
+    def get_or_create_collection(self, name):
+        return self.collections.setdefault(name, FakeCollection(name))
+
+    def get_collection(self, name):
+        if name not in self.collections:
+            raise ValueError(f"Collection {name} does not exist.")
+        return self.collections[name]
+
+    def delete_collection(self, name):
+        self.collections.pop(name, None)
+
+    def list_collections(self):
+        return list(self.collections.values())
+
+# === MEASUREMENT ===
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def summarize(latencies, items=None):
+    import numpy as np
+    total = sum(latencies)
+    p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+    return {
+        "runs": len(latencies),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "mean_ms": round(total / len(latencies) * 1000, 3),
+        "throughput_per_s": round((items or len(latencies)) / total, 3) if total else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+def print_report(results, baseline=None):
+    print(f"\n{'stage':<16}{'p50 ms':>10}{'p95 ms':>10}{'per sec':>10}{'RSS MB':>9}")
+    for stage, stats in results["stages"].items():
+        line = (f"{stage:<16}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+                f"{stats['throughput_per_s'] or 0:>10.1f}{stats['peak_rss_mb']:>9.0f}")
+        previous = (baseline or {}).get("stages", {}).get(stage)
+        if previous and previous["p50_ms"]:
+            line += f"   p50 x{stats['p50_ms'] / previous['p50_ms']:.2f} vs {baseline.get('commit')}"
+        print(line)
+
+# === BENCHMARK ===
+def run(args):
+    from app.backend import chroma, retrieve
+    from app.backend.prompting import build_prompt
+    from app.chunking.chunk_patch_notes import chunk_patch
+    from app.chunking.chunk_store import iter_patch_chunks
+    from app.config import CHUNKING_MODE, PATCH_DIR, get_chroma_host
+    from app.embedding.build_chroma import build_chroma
+
+    # Route every Chroma access of the pipeline to the fake client
+    fake = FakeChromaClient()
+    chroma._clients[get_chroma_host()] = fake
+
+    latencies = {stage: [] for stage in (
+        "chunk", "ingest", "search_chunks", "rerank_chunks", "build_prompt", "generate_answer"
+    )}
+    chunk_count = 0
+    chunked_count = 0
+
+    # Chunking: the production chunker on the raw patch files (timed alone, its output is not indexed)
+    patches = {}
+    for version in args.versions:
+        with open(os.path.join(PATCH_DIR, f"patch_{version}.json"), "r", encoding="utf-8") as f:
+            patches[version] = json.load(f)
+    for _ in range(args.repeat):
+        for version in args.versions:
+            elapsed, (chunks, _) = timed(chunk_patch, patches[version], hierarchical=CHUNKING_MODE == "hierarchical")
+            latencies["chunk"].append(elapsed)
+            chunked_count += len(chunks)
+    chunk_stats = summarize(latencies["chunk"], items=chunked_count)
+
+    # Ingestion: embed + index the bundled chunk file of every patch (collections rebuilt each run)
+    for _ in range(args.repeat):
+        for version in args.versions:
+            def ingest():
+                chunks = list(iter_patch_chunks(version))
+                build_chroma(chunks, f"patch_{version}", rebuild=True)
+                return len(chunks)
+            elapsed, count = timed(ingest)
+            latencies["ingest"].append(elapsed)
+            chunk_count += count
+    chroma.invalidate_collection_cache()
+    ingest_stats = summarize(latencies["ingest"], items=chunk_count)
+
+    # One question per champion of each patch, the way users phrase them
+    questions = []
+    for version in args.versions:
+        champions = sorted({meta["champion"] for meta in fake.get_collection(f"patch_{version}").get()["metadatas"]
+                            if meta.get("champion")})
+        questions += [(version, f"Quels changements pour {champion} dans le patch {version} ?") for champion in champions]
+    history = [
+        {"role": "user", "content": "Quels champions ont été modifiés ?"},
+        {"role": "assistant", "content": "Plusieurs champions ont reçu des ajustements de dégâts et de jungle."},
+    ]
+
+    for _ in range(args.repeat):
+        for version, question in questions:
+            collection = chroma.get_collection_safe(f"patch_{version}")
+            if not args.warm_caches:
+                retrieve.query_embedding_cache.clear()
+
+            elapsed, raw = timed(retrieve.search_chunks, question, collection, k=10)
+            latencies["search_chunks"].append(elapsed)
+
+            docs = [doc for doc, _, _ in raw]
+            metas = [meta for _, meta, _ in raw]
+            distances = [dist for _, _, dist in raw]
+            elapsed, top = timed(retrieve.rerank_chunks, question, docs, metas, top_k=7, distances=distances)
+            latencies["rerank_chunks"].append(elapsed)
+
+            elapsed, _ = timed(build_prompt, [doc for doc, _ in top], question, history=history)
+            latencies["build_prompt"].append(elapsed)
+
+            if not args.warm_caches:
+                retrieve.query_embedding_cache.clear()
+            elapsed, _ = timed(retrieve.generate_answer, question, history=history, versions=[version])
+            latencies["generate_answer"].append(elapsed)
+
+    stages = {"chunk": chunk_stats, "ingest": ingest_stats}
+    stages.update({stage: summarize(values) for stage, values in latencies.items() if stage not in stages})
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "versions": args.versions,
+            "repeat": args.repeat,
+            "questions": len(questions),
+            "chunks_per_ingest_run": chunk_count // args.repeat,
+            "ollama_delay_ms": args.ollama_delay_ms,
+            "warm_caches": args.warm_caches,
+            "env": {key: os.environ.get(key) for key in (
+                "INFERENCE_BACKEND", "CHUNKING_MODE", "RERANK_TIER", "RERANK_SKIP_MARGIN", "HYBRID_RETRIEVAL", "ENTITY_FILTER",
+                "MICRO_BATCHING", "EMBED_BATCH_SIZE",
+            ) if os.environ.get(key) is not None},
+        },
+        "stages": stages,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--versions", nargs="+", default=["25.06", "25.07"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--ollama-delay-ms", type=float, default=0.0, help="simulated generation time")
+    parser.add_argument("--warm-caches", action="store_true", help="keep the query and answer caches enabled")
+    parser.add_argument("--output", default=None, help="JSON results file (default: data/benchmarks/<commit>_<time>.json)")
+    parser.add_argument("--baseline", default=None, help="previous results file to compare p50 against")
+    args = parser.parse_args()
+
+    ollama = start_fake_ollama(args.ollama_delay_ms)
+    scratch = tempfile.mkdtemp(prefix="leaguegpt-bench-")
+
+    # Settings are read from the environment when app.config is imported
+    os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{ollama.server_address[1]}"
+    os.environ["RETRIEVAL_BACKEND"] = "chroma"
+    os.environ["VECTOR_INDEX_DIR"] = os.path.join(scratch, "vector_index")
+    os.environ["EMBED_CACHE_DIR"] = ""  # ingestion always embeds
+    if not args.warm_caches:
+        os.environ["ANSWER_CACHE_TTL"] = "0"  # the query cache is cleared per question instead
+    sys.path.append(ROOT)
+
+    results = run(args)
+    ollama.shutdown()
+
+    output = args.output or os.path.join(
+        ROOT, "data", "benchmarks", f"{results['commit'] or 'nogit'}_{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    print(f"\nResults written to {output}")
@@ -0,0 +1,49 @@
+# scripts/bench_retrieval_backends.py
+"""
+Compares top-k query latency of the Chroma server and the in-process NumPy index.
+Query vectors are perturbed copies of the indexed vectors, so no model is loaded and only retrieval is timed.
+
+Usage: python scripts/bench_retrieval_backends.py [--version 25.07] [--queries 200] [-k 10]
+"""
+import argparse
+import os
+import sys
+import time
+
+# Extend sys.path to access app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import numpy as np
+from app.backend.chroma import get_chroma_client, get_latest_patch_version
+from app.backend.vector_index import get_local_collection
+
+def bench(name, collection, queries, k):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        collection.query(query_embeddings=[query.tolist()], n_results=k, include=["documents", "metadatas", "distances"])
+        latencies.append((time.perf_counter() - start) * 1000)
+    p50, p95 = np.percentile(latencies, [50, 95])
+    print(f"{name:<8} p50 {p50:8.3f} ms   p95 {p95:8.3f} ms   mean {np.mean(latencies):8.3f} ms")
+    return latencies
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--version", default=None)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    name = f"patch_{args.version or get_latest_patch_version()}"
+    local = get_local_collection(name)
+    if local is None:
+        sys.exit("Run build_chroma first to write the local index.")
+
+    rng = np.random.default_rng(0)
+    base = np.asarray(local.embeddings)[rng.integers(0, local.count(), args.queries)]
+    queries = base + rng.normal(scale=0.02, size=base.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    print(f"{args.queries} queries, top-{args.k}, {local.count()} vectors in {name}")
+    bench("local", local, queries, args.k)
+    bench("chroma", get_chroma_client().get_collection(name=name), queries, args.k)
@@ -0,0 +1,27 @@
+# scripts/convert_chunk_files.py
+"""
+Converts legacy chunks_<version>.json files (pretty-printed JSON arrays) to the streaming JSONL format.
+
+Usage: python scripts/convert_chunk_files.py [--dir data/patch_notes/chunks] [--keep]
+"""
+import argparse
+import os
+import sys
+
+# Extend sys.path to access app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.chunking.chunk_store import LEGACY_SUFFIX, convert_chunk_file
+from app.config import CHUNK_DIR
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=CHUNK_DIR)
+    parser.add_argument("--keep", action="store_true", help="keep the .json files next to the converted ones")
+    args = parser.parse_args()
+
+    legacy = sorted(f for f in os.listdir(args.dir) if f.startswith("chunks_") and f.endswith(LEGACY_SUFFIX))
+    if not legacy:
+        print(f"No legacy chunk files in {args.dir}")
+    for filename in legacy:
+        convert_chunk_file(os.path.join(args.dir, filename), remove=not args.keep)
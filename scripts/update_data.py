@@ -7,20 +7,20 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from app.ingestion.generate_chunks import run_ingestion_pipeline
 from app.embedding.build_chroma import build_chroma
-from app.chunking.chunk_patch_notes import chunk_from_riot_json
-from app.config import CHUNK_DIR, PATCH_DIR, get_chroma_host
-import chromadb
+from app.chunking.chunk_patch_notes import chunk_patch
+from app.chunking.chunk_store import read_chunking_mode, save_patch_chunks
+from app.backend.chroma import get_chroma_client, invalidate_collection_cache
+from app.config import CHUNK_DIR, CHUNKING_MODE, PATCH_DIR
 import json
 
 # Ensure chunk directory exists
 os.makedirs(CHUNK_DIR, exist_ok=True)
 
-# Initialize Chroma client
-host, port = get_chroma_host()
-client = chromadb.HttpClient(host=host, port=port)
-
 print("Step 1: Downloading + parsing patches...")
-run_ingestion_pipeline(limit=3)
+updated_versions = run_ingestion_pipeline(limit=3)
+
+# Collections already in Chroma (list_collections returns names or collection objects depending on the version)
+indexed = {getattr(c, "name", c) for c in get_chroma_client().list_collections()}
 
 # Iterate through all patch files in the patch directory
 for filename in os.listdir(PATCH_DIR):
@@ -28,24 +28,29 @@ for filename in os.listdir(PATCH_DIR):
         patch_version = filename.split("_")[-1].replace(".json", "")
         collection_name = f"patch_{patch_version}"
 
-        # Skip if collection already exists in Chroma
-        existing_collections = client.list_collections()
-        if collection_name in existing_collections:
-            print(f" Patch {patch_version} already indexed in Chroma, skipping.")
+        # Nothing to do for patches whose page did not change and that are already indexed
+        # with chunks of the current CHUNKING_MODE
+        if (patch_version not in updated_versions and collection_name in indexed
+                and read_chunking_mode(patch_version) == CHUNKING_MODE):
+            print(f"Patch {patch_version} unchanged and already indexed, skipping.")
             continue
 
         # Load patch file and chunk it
         with open(os.path.join(PATCH_DIR, filename), "r", encoding="utf-8") as f:
             data = json.load(f)
 
-        chunks = chunk_from_riot_json(data)
+        chunks, parents = chunk_patch(data, hierarchical=CHUNKING_MODE == "hierarchical")
 
         print(f"{len(chunks)} chunks for patch {patch_version}")
 
-        # Save chunks to file
-        with open(os.path.join(CHUNK_DIR, f"chunks_{patch_version}.json"), "w", encoding="utf-8") as f:
-            json.dump(chunks, f, indent=2, ensure_ascii=False)
+        # Save chunks to file (one JSON object per line), with the mode they were chunked in
+        save_patch_chunks(patch_version, chunks, parents, CHUNKING_MODE)
 
-        # Index chunks into Chroma
+        # Sync chunks into Chroma: chunk IDs are content hashes, so unchanged
+        # patches only cost an ID listing and nothing is re-embedded
         os.environ["ENV"] = "local"
         build_chroma(chunks, collection_name)
+
+# Drop cached collection handles, here and in the running server (through the invalidation marker file),
+# so the next question sees the new patches
+invalidate_collection_cache()